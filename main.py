@@ -3,12 +3,13 @@ from src.app.config.response import http_exception_handler
 from fastapi.exceptions import RequestValidationError, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from src.app import init_app
+from src.app import init_app, lifespan
 
 app = FastAPI(
     title="ATATEK - онлайн шежіре",
     version="3.0.0",
     description="Жаңа нұсқа жаңа фреймворкта FastAPI",
+    lifespan=lifespan,
 )
 app.add_middleware(
     CORSMiddleware,
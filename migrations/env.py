@@ -26,6 +26,7 @@ from src.app.aulet.models import *
 from src.app.ticket.models import *
 from src.app.page_news.models import *
 from src.app.page_popular_peoples.models import *
+from src.app.stats.models import *
 
 target_metadata = Base.metadata
 
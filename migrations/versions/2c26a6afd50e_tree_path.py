@@ -0,0 +1,54 @@
+"""tree path
+
+Revision ID: 2c26a6afd50e
+Revises: 592a166e14ee
+Create Date: 2026-10-18 10:12:41.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c26a6afd50e'
+down_revision: Union[str, None] = '592a166e14ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tree', sa.Column('path', postgresql.ARRAY(sa.Integer()), server_default='{}', nullable=False))
+    op.add_column('tree', sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+
+    # Заполняем путь от корней вниз. Корнем считается и узел, чей родитель не найден.
+    # Ограничение глубины защищает от циклов в parent_id.
+    op.execute("""
+        WITH RECURSIVE chain AS (
+            SELECT t.id, ARRAY[]::integer[] AS path
+            FROM tree t
+            WHERE t.parent_id IS NULL
+               OR NOT EXISTS (SELECT 1 FROM tree p WHERE p.id = t.parent_id)
+            UNION ALL
+            SELECT t.id, c.path || t.parent_id
+            FROM tree t
+            JOIN chain c ON t.parent_id = c.id
+            WHERE cardinality(c.path) < 512
+        )
+        UPDATE tree
+        SET path = chain.path, depth = cardinality(chain.path)
+        FROM chain
+        WHERE tree.id = chain.id
+    """)
+
+    op.create_index('ix_tree_path', 'tree', ['path'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tree_path', table_name='tree', postgresql_using='gin')
+    op.drop_column('tree', 'depth')
+    op.drop_column('tree', 'path')
@@ -0,0 +1,37 @@
+"""tree updated_at index
+
+Revision ID: 4c8b1e6d0a95
+Revises: f2a7c4d9e816
+Create Date: 2026-10-18 23:04:12.583019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8b1e6d0a95'
+down_revision: Union[str, None] = 'f2a7c4d9e816'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Индекс подсказок и снимок дерева каждые несколько секунд читают строки
+    # с updated_at >= водяного знака. Строим без блокировки записи, как в d71c5e9b2f48
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tree_updated_at', 'tree', ['updated_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tree_updated_at', table_name='tree', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,32 @@
+"""tree name trgm
+
+Revision ID: 7f3b9c2e41d8
+Revises: 2c26a6afd50e
+Create Date: 2026-10-18 13:40:09.518233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3b9c2e41d8'
+down_revision: Union[str, None] = '2c26a6afd50e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_tree_name_trgm', 'tree', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tree_name_trgm', table_name='tree', postgresql_using='gin')
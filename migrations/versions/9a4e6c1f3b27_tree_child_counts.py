@@ -0,0 +1,55 @@
+"""tree child counts
+
+Revision ID: 9a4e6c1f3b27
+Revises: e58d2f17a9c3
+Create Date: 2026-10-18 19:04:12.538906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4e6c1f3b27'
+down_revision: Union[str, None] = 'e58d2f17a9c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tree', sa.Column('child_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tree', sa.Column('descendant_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Пересчёт снизу вверх по поколениям: у листьев остаются нули,
+    # каждый следующий уровень суммирует уже посчитанных детей
+    op.execute("""
+        DO $$
+        DECLARE
+            level integer;
+        BEGIN
+            FOR level IN SELECT DISTINCT depth FROM tree ORDER BY depth DESC LOOP
+                UPDATE tree
+                SET child_count = counts.children,
+                    descendant_count = counts.descendants
+                FROM (
+                    SELECT c.parent_id AS id,
+                           count(*) AS children,
+                           sum(1 + c.descendant_count) AS descendants
+                    FROM tree c
+                    JOIN tree p ON p.id = c.parent_id
+                    WHERE p.depth = level AND c.is_deleted IS NOT TRUE
+                    GROUP BY c.parent_id
+                ) AS counts
+                WHERE tree.id = counts.id;
+            END LOOP;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tree', 'descendant_count')
+    op.drop_column('tree', 'child_count')
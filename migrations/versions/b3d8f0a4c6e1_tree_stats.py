@@ -0,0 +1,39 @@
+"""tree stats
+
+Revision ID: b3d8f0a4c6e1
+Revises: 9a4e6c1f3b27
+Create Date: 2026-10-18 20:37:05.621384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8f0a4c6e1'
+down_revision: Union[str, None] = '9a4e6c1f3b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица заполняется фоновым воркером статистики при первом запуске приложения
+    op.create_table('tree_stats',
+    sa.Column('tree_id', sa.Integer(), nullable=False),
+    sa.Column('descendants', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('generations', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('living', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('dead', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unknown', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('contributors', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('tree_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('tree_stats')
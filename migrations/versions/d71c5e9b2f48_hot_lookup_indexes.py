@@ -0,0 +1,62 @@
+"""hot lookup indexes
+
+Revision ID: d71c5e9b2f48
+Revises: b3d8f0a4c6e1
+Create Date: 2026-10-18 21:15:48.902263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd71c5e9b2f48'
+down_revision: Union[str, None] = 'b3d8f0a4c6e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (имя индекса, таблица, колонки, условие частичного индекса)
+# tree.t_id уже покрыт частичным уникальным ux_tree_t_id (t_id > 0)
+INDEXES = [
+    ('ix_tree_parent_id_alive', 'tree', ['parent_id', 'id'], 'is_deleted IS NOT TRUE'),
+    ('ix_tree_created_by', 'tree', ['created_by'], None),
+    ('ix_aulet_user_id', 'aulet', ['user_id'], None),
+    ('ix_aulet_relation_node_id', 'aulet_relation', ['node_id'], None),
+    ('ix_aulet_relation_related_node_id', 'aulet_relation', ['related_node_id'], None),
+    ('ix_user_roles_user_id', 'user_roles', ['user_id'], None),
+    ('ix_user_tariffs_user_id', 'user_tariffs', ['user_id'], None),
+    ('ix_pages_tree_id', 'pages', ['tree_id'], None),
+    ('ix_page_moderator_page_id_user_id', 'page_moderator', ['page_id', 'user_id'], None),
+    ('ix_page_moderator_user_id', 'page_moderator', ['user_id'], None),
+    ('ix_page_news_page_id', 'page_news', ['page_id'], None),
+    ('ix_ticket_add_data_ticket_id', 'ticket_add_data', ['ticket_id'], None),
+    ('ix_ticket_edit_data_ticket_id', 'ticket_edit_data', ['ticket_id'], None),
+    ('ix_tickets_created_by', 'tickets', ['created_by'], None),
+    ('ix_users_phone', 'users', ['phone'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции и не блокирует запись в таблицы.
+    # if_not_exists: после прерванного запуска миграцию можно просто повторить
+    # (невалидный индекс от упавшего CONCURRENTLY нужно удалить вручную)
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                unique=False,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,40 @@
+"""tree t_id unique
+
+Revision ID: e58d2f17a9c3
+Revises: c41e0a9d5b72
+Create Date: 2026-10-18 18:21:50.114736
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e58d2f17a9c3'
+down_revision: Union[str, None] = 'c41e0a9d5b72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Дубликаты от параллельных раскрытий: оставляем связь с tumalas у первой строки,
+    # у остальных снимаем t_id, сами узлы не удаляем. Индекса по t_id ещё нет,
+    # поэтому дубликаты ищем одним проходом с оконной функцией
+    op.execute("""
+        UPDATE tree SET t_id = NULL
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY t_id ORDER BY id) AS rn
+            FROM tree
+            WHERE t_id > 0
+        ) d
+        WHERE tree.id = d.id AND d.rn > 1
+    """)
+    op.create_index('ux_tree_t_id', 'tree', ['t_id'], unique=True, postgresql_where=sa.text('t_id > 0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_tree_t_id', table_name='tree', postgresql_where=sa.text('t_id > 0'))
@@ -0,0 +1,42 @@
+"""tree t_hash
+
+Revision ID: f2a7c4d9e816
+Revises: d71c5e9b2f48
+Create Date: 2026-10-18 22:08:31.447190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a7c4d9e816'
+down_revision: Union[str, None] = 'd71c5e9b2f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Хэш не заполняем по локальным данным: в них могут быть одобренные правки,
+    # и хэш разошёлся бы с tumalas. Первая синхронизация только запишет хэш.
+    op.add_column('tree', sa.Column('t_hash', sa.String(length=32), nullable=True))
+    op.add_column('tree', sa.Column('t_override', sa.Boolean(), server_default='false', nullable=False))
+
+    # Правки, одобренные до этой миграции, тоже защищаем от перезаписи из tumalas
+    op.execute("""
+        UPDATE tree SET t_override = true
+        FROM ticket_edit_data e
+        JOIN tickets t ON t.id = e.ticket_id
+        WHERE tree.id = e.tree_id
+          AND tree.t_id > 0
+          AND t.status = 'approved'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tree', 't_override')
+    op.drop_column('tree', 't_hash')
@@ -0,0 +1,118 @@
+"""
+Бенчмарк TreeService.get_parents на синтетической глубокой ветке.
+
+Сравнивает старый обход (два SELECT на каждое поколение) с текущей
+реализацией по числу обращений к БД и задержке. Данные создаются
+внутри транзакции и откатываются в конце, база не меняется.
+
+    python -m scripts.bench_tree_parents --depth 30 --runs 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.app.db.core import async_engine
+from src.app.tree.models import Tree
+from src.app.tree.service import TreeService
+
+
+async def legacy_get_parents(db: AsyncSession, tree_id: int, parent_id: int = None):
+    """Исходная реализация get_parents: два SELECT на каждое поколение"""
+    parents = []
+    current_id = tree_id
+
+    while current_id is not None:
+        result = await db.execute(select(Tree).where(Tree.id == current_id))
+        node = result.scalar_one_or_none()
+        if not node or node.parent_id is None:
+            break
+
+        result = await db.execute(select(Tree).where(Tree.id == node.parent_id))
+        parent = result.scalar_one_or_none()
+        if not parent:
+            break
+        parents.append({"id": parent.id, "name": parent.name})
+        current_id = parent.id
+
+    if not parents:
+        return False
+    if parent_id and not any(p["id"] == parent_id for p in parents):
+        return False
+    return parents[::-1]
+
+
+async def build_chain(db: AsyncSession, depth: int) -> int:
+    """Создает линию из depth поколений и возвращает id самого нижнего узла"""
+    parent_id = None
+    path = []
+    for level in range(depth + 1):
+        result = await db.execute(
+            insert(Tree)
+            .values(
+                name=f"bench-{level}",
+                parent_id=parent_id,
+                is_deleted=False,
+                t_id=0,
+                path=path,
+                depth=len(path),
+            )
+            .returning(Tree.id)
+        )
+        parent_id = result.scalar_one()
+        path = [*path, parent_id]
+    return parent_id
+
+
+async def measure(name: str, func, runs: int, counter: dict):
+    timings = []
+    counter["n"] = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await func()
+        timings.append((time.perf_counter() - started) * 1000)
+    round_trips = counter["n"] / runs
+    print(
+        f"{name:<10} round trips: {round_trips:>6.1f}  "
+        f"p50: {statistics.median(timings):>8.2f} ms  "
+        f"max: {max(timings):>8.2f} ms"
+    )
+    return result
+
+
+async def main(depth: int, runs: int):
+    counter = {"n": 0}
+
+    def count_statement(*args):
+        counter["n"] += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    async with async_engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            db = AsyncSession(bind=conn)
+            leaf_id = await build_chain(db, depth)
+            service = TreeService(db)
+
+            legacy = await measure("legacy", lambda: legacy_get_parents(db, leaf_id), runs, counter)
+            current = await measure("current", lambda: service.get_parents(leaf_id), runs, counter)
+
+            assert legacy == current, "Результаты реализаций не совпадают"
+            print(f"depth={depth}, ancestors={len(current)}: результаты совпадают")
+        finally:
+            await transaction.rollback()
+
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=30, help="Количество поколений в синтетической ветке")
+    parser.add_argument("--runs", type=int, default=50, help="Количество прогонов каждой реализации")
+    args = parser.parse_args()
+    asyncio.run(main(args.depth, args.runs))
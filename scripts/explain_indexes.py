@@ -0,0 +1,103 @@
+"""
+Проверка, что запросы сервисов используют индексы из миграций.
+
+Для каждого запроса выполняется EXPLAIN (FORMAT JSON) и в плане ищется
+ожидаемый индекс. Запросы берутся из построителей сервисов, чтобы проверялось
+ровно то, что выполняется; для сервисов без построителей запрос повторяет
+условие из кода сервиса. Последовательное чтение отключается (enable_seqscan = off):
+на маленькой базе планировщик и так выбрал бы его, а проверяем мы именно
+применимость индекса к условию запроса. БД не изменяется.
+
+    python -m scripts.explain_indexes
+"""
+import asyncio
+import json
+import sys
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from src.app.db.core import async_engine
+from src.app.auth.models import User
+from src.app.aulet.models import Aulet, AuletRelation
+from src.app.page_news.models import PageNews
+from src.app.pages.models import Page, PageModerator
+from src.app.role.service import RoleService
+from src.app.tariff.models import UserTariff
+from src.app.ticket.models import Ticket, TicketAddData, TicketEditData
+from src.app.tree.models import Tree
+from src.app.tree.service import TreeService
+
+# (запрос сервиса, ожидаемый индекс)
+CHECKS = [
+    ("TreeService._children_stmt", TreeService._children_stmt(1), "ix_tree_parent_id_alive"),
+    ("TreeService._children_page_stmt", TreeService._children_page_stmt(1, 100, 50), "ix_tree_parent_id_alive"),
+    ("TreeService._tumalas_hashes_stmt", TreeService._tumalas_hashes_stmt([1, 2, 3]), "ux_tree_t_id"),
+    (
+        "NameIndex.refresh, TreeSnapshot.refresh",
+        select(Tree.id, Tree.parent_id, Tree.is_deleted, Tree.updated_at).where(Tree.updated_at >= datetime(2026, 1, 1)),
+        "ix_tree_updated_at",
+    ),
+    ("AuthService: записи пользователя", select(Tree).where(Tree.created_by == 1), "ix_tree_created_by"),
+    ("AuthService.login", select(User).where(User.phone == "77000000000"), "ix_users_phone"),
+    ("RoleService._role_stmt", RoleService._role_stmt(1), "ix_user_roles_user_id"),
+    ("TariffService", select(UserTariff).where(UserTariff.user_id == 1), "ix_user_tariffs_user_id"),
+    ("AuletService: люди пользователя", select(Aulet).where(Aulet.user_id == 1), "ix_aulet_user_id"),
+    ("AuletService: связи", select(AuletRelation).where(AuletRelation.node_id.in_([1, 2])), "ix_aulet_relation_node_id"),
+    (
+        "AuletService: обратные связи",
+        select(AuletRelation).where(AuletRelation.related_node_id == 1),
+        "ix_aulet_relation_related_node_id",
+    ),
+    ("PageService.create_page", select(Page).where(Page.tree_id == 1), "ix_pages_tree_id"),
+    (
+        "PageService.set_moderator",
+        select(PageModerator).where(PageModerator.page_id == 1, PageModerator.user_id == 2),
+        "ix_page_moderator_page_id_user_id",
+    ),
+    ("PageService.moderator_pages", select(PageModerator).where(PageModerator.user_id == 1), "ix_page_moderator_user_id"),
+    ("PageNewsService", select(PageNews).where(PageNews.page_id == 1), "ix_page_news_page_id"),
+    ("TicketService.get_tickets_by_user", select(Ticket).where(Ticket.created_by == 1), "ix_tickets_created_by"),
+    ("TicketService: данные добавления", select(TicketAddData).where(TicketAddData.ticket_id == 1), "ix_ticket_add_data_ticket_id"),
+    ("TicketService: данные правки", select(TicketEditData).where(TicketEditData.ticket_id == 1), "ix_ticket_edit_data_ticket_id"),
+]
+
+
+def plan_indexes(plan: dict) -> set[str]:
+    """Имена индексов во всех узлах плана"""
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= plan_indexes(child)
+    return names
+
+
+async def main() -> int:
+    failed = 0
+    async with async_engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, stmt, index in CHECKS:
+                sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+                explain = result.scalar_one()
+                if isinstance(explain, str):
+                    explain = json.loads(explain)
+
+                used = plan_indexes(explain[0]["Plan"])
+                ok = index in used
+                failed += not ok
+                print(f"{'OK  ' if ok else 'FAIL'} {name:<48} {index:<36} план: {', '.join(sorted(used)) or 'без индексов'}")
+        finally:
+            await transaction.rollback()
+
+    await async_engine.dispose()
+    return failed
+
+
+if __name__ == "__main__":
+    failed = asyncio.run(main())
+    if failed:
+        print(f"Индекс не используется в {failed} запросах")
+    sys.exit(1 if failed else 0)
@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from src.app.db.views import router as db_router
 from src.app.address.views import router as address_router
 from src.app.auth.views import router as auth_router
@@ -7,6 +9,29 @@ from src.app.ticket.views import router as ticket_router
 from src.app.pages.views import router as pages_router
 from src.app.page_news.views import router as page_news_router
 from src.app.page_popular_peoples.views import router as page_popular_peoples_router
+from src.app.stats.views import router as stats_router
+from src.app.stats.worker import stats_worker
+from src.app.tree.prefetch import tree_prefetch
+from src.app.tree.snapshot import tree_snapshot
+from src.app.tree.suggest import suggest_index
+from src.app.tree.tumalas import tumalas_client
+from src.app.tree.sync import tree_sync
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await suggest_index.start()
+    await tree_sync.start()
+    await stats_worker.start()
+    await tree_snapshot.start()
+    await tree_prefetch.start()
+    yield
+    await tree_prefetch.stop()
+    await tree_snapshot.stop()
+    await stats_worker.stop()
+    await tree_sync.stop()
+    await suggest_index.stop()
+    await tumalas_client.close()
 
 
 def init_app(app):
@@ -18,6 +43,7 @@ def init_app(app):
     app.include_router(page_popular_peoples_router, prefix="/page_popular_peoples", tags=["page_popular_peoples"])
     app.include_router(ticket_router, prefix="/ticket", tags=["ticket"])
     app.include_router(aulet_router, prefix="/aulet", tags=["menin-auletim"])
+    app.include_router(stats_router, prefix="/stats", tags=["stats"])
     app.include_router(db_router, prefix="/db", tags=["db"])
     return app
 
@@ -20,7 +20,7 @@ class Aulet(Base):
     __tablename__ = 'aulet'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     first_name: Mapped[str] = mapped_column(nullable=False)
     last_name: Mapped[str] = mapped_column(nullable=False)
@@ -44,8 +44,8 @@ class AuletRelation(Base):
 
     type: Mapped[Relation] = mapped_column(nullable=False)
 
-    node_id: Mapped[int] = mapped_column(Integer, nullable=False)
-    related_node_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    node_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    related_node_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     created_at: Mapped[datetime] = mapped_column(nullable=True, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(nullable=True, server_default=func.now(), server_onupdate=func.now())
@@ -13,7 +13,7 @@ class User(Base):
     last_name: Mapped[str] = mapped_column(String(50), nullable=False)
     middle_name: Mapped[str] = mapped_column(String(50), nullable=True)
 
-    phone: Mapped[str] = mapped_column(String(12), nullable=True)
+    phone: Mapped[str] = mapped_column(String(12), nullable=True, index=True)
     password: Mapped[str] = mapped_column(String(255), nullable=True)
 
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=True, default=True)
@@ -11,6 +11,41 @@ class Settings(BaseSettings):
 
     JWT_SECRET_KEY: str = os.getenv('JWT_SECRET_KEY', 'dadada')
 
+    TUMALAS_BASE_URL: str = os.getenv('TUMALAS_BASE_URL', 'https://tumalas.kz/wp-admin/admin-ajax.php?action=tuma_cached_childnew_get&nodeid=14')
+    TUMALAS_CONNECT_TIMEOUT: float = float(os.getenv('TUMALAS_CONNECT_TIMEOUT', '3'))
+    TUMALAS_READ_TIMEOUT: float = float(os.getenv('TUMALAS_READ_TIMEOUT', '10'))
+    TUMALAS_MAX_CONNECTIONS: int = int(os.getenv('TUMALAS_MAX_CONNECTIONS', '20'))
+    TUMALAS_BREAKER_THRESHOLD: int = int(os.getenv('TUMALAS_BREAKER_THRESHOLD', '5'))
+    TUMALAS_BREAKER_RESET_SECONDS: float = float(os.getenv('TUMALAS_BREAKER_RESET_SECONDS', '30'))
+    TUMALAS_SYNC_TTL_SECONDS: int = int(os.getenv('TUMALAS_SYNC_TTL_SECONDS', '86400'))
+    TUMALAS_SYNC_WORKERS: int = int(os.getenv('TUMALAS_SYNC_WORKERS', '4'))
+    TUMALAS_SYNC_QUEUE_SIZE: int = int(os.getenv('TUMALAS_SYNC_QUEUE_SIZE', '10000'))
+    TREE_PREFETCH_WORKERS: int = int(os.getenv('TREE_PREFETCH_WORKERS', '2'))
+    TREE_PREFETCH_QUEUE_SIZE: int = int(os.getenv('TREE_PREFETCH_QUEUE_SIZE', '1000'))
+    TREE_PREFETCH_MAX_CHILDREN: int = int(os.getenv('TREE_PREFETCH_MAX_CHILDREN', '20'))
+    TREE_PREFETCH_WINDOW_SECONDS: int = int(os.getenv('TREE_PREFETCH_WINDOW_SECONDS', '300'))
+    TREE_PREFETCH_MAX_CONNECTIONS: int = int(os.getenv('TREE_PREFETCH_MAX_CONNECTIONS', '2'))
+
+    TREE_SUGGEST_REFRESH_SECONDS: int = int(os.getenv('TREE_SUGGEST_REFRESH_SECONDS', '30'))
+    TREE_SUGGEST_MAX_KEYS: int = int(os.getenv('TREE_SUGGEST_MAX_KEYS', '500000'))
+    TREE_SUGGEST_MAX_IDS_PER_KEY: int = int(os.getenv('TREE_SUGGEST_MAX_IDS_PER_KEY', '20'))
+    TREE_CHILDREN_CACHE_TTL_SECONDS: int = int(os.getenv('TREE_CHILDREN_CACHE_TTL_SECONDS', '300'))
+    TREE_CHILDREN_CACHE_MAX_ENTRIES: int = int(os.getenv('TREE_CHILDREN_CACHE_MAX_ENTRIES', '20000'))
+    TREE_CASCADE_MAX_NODES: int = int(os.getenv('TREE_CASCADE_MAX_NODES', '50000'))
+    TREE_PEDIGREE_CACHE_TTL_SECONDS: int = int(os.getenv('TREE_PEDIGREE_CACHE_TTL_SECONDS', '3600'))
+    TREE_PEDIGREE_CACHE_MAX_ENTRIES: int = int(os.getenv('TREE_PEDIGREE_CACHE_MAX_ENTRIES', '20000'))
+    TREE_PEDIGREE_MAX_AGE_SECONDS: int = int(os.getenv('TREE_PEDIGREE_MAX_AGE_SECONDS', '60'))
+    TREE_SNAPSHOT_PATH: str = os.getenv('TREE_SNAPSHOT_PATH', '/tmp/atatek-tree.snapshot')
+    TREE_SNAPSHOT_REFRESH_SECONDS: int = int(os.getenv('TREE_SNAPSHOT_REFRESH_SECONDS', '10'))
+    TREE_SNAPSHOT_MAX_LAG_SECONDS: int = int(os.getenv('TREE_SNAPSHOT_MAX_LAG_SECONDS', '60'))
+    TREE_SNAPSHOT_REBUILD_SECONDS: int = int(os.getenv('TREE_SNAPSHOT_REBUILD_SECONDS', '3600'))
+    TREE_SNAPSHOT_MAX_OVERLAY: int = int(os.getenv('TREE_SNAPSHOT_MAX_OVERLAY', '100000'))
+    ROLE_CACHE_TTL_SECONDS: int = int(os.getenv('ROLE_CACHE_TTL_SECONDS', '60'))
+
+    STATS_REFRESH_SECONDS: int = int(os.getenv('STATS_REFRESH_SECONDS', '60'))
+    STATS_REBUILD_SECONDS: int = int(os.getenv('STATS_REBUILD_SECONDS', '86400'))
+    STATS_LIFESPAN_YEARS: int = int(os.getenv('STATS_LIFESPAN_YEARS', '100'))
+
     @property
     def get_base_link(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Integer, String, Boolean, DateTime, func
+from sqlalchemy import Integer, String, Boolean, DateTime, func, Index
 from sqlalchemy.orm import mapped_column, Mapped
 
 from src.app.db.core import Base
@@ -12,7 +12,7 @@ class Page(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     title: Mapped[str] = mapped_column(String(255), nullable=False)
-    tree_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    tree_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     bread1: Mapped[str] = mapped_column(String(255), nullable=False)
     bread2: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -37,11 +37,14 @@ class UserPage(Base):
 
 class PageModerator(Base):
     __tablename__ = 'page_moderator'
+    __table_args__ = (
+        Index('ix_page_moderator_page_id_user_id', 'page_id', 'user_id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     page_id: Mapped[int] = mapped_column(Integer, nullable=False)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
     
 
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=True)
@@ -1,4 +1,5 @@
 import re
+import time
 from typing import Optional
                                                 
 from argon2 import PasswordHasher
@@ -7,10 +8,25 @@ from fastapi import HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.app.config.base import settings
 from src.app.role.models import *
 from src.app.role.schemas import *
 
 
+# user_id -> (истекает в, role_id), запасной вариант для запросов без роли в токене
+_role_cache: dict[int, tuple[float, int]] = {}
+
+
+def role_from_claims(claims: Optional[dict]) -> Optional[int]:
+    """id роли из проверенного JWT: auth кладёт её в additional_data при входе"""
+    if not claims:
+        return None
+    role = claims.get("role")
+    if isinstance(role, dict) and role.get("id") is not None:
+        return int(role["id"])
+    return None
+
+
 class RoleService:
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -33,6 +49,7 @@ class RoleService:
             user_role = UserRole(user_id=user_id, role_id=role_id)
             self.db.add(user_role)
             await self.db.commit()
+            _role_cache.pop(user_id, None)
             return {"message": "Пользователь успешно привязан к роли"}
 
         except SQLAlchemyError as e:
@@ -42,12 +59,37 @@ class RoleService:
                 detail="Ошибка при привязке роли к пользователю"
             )
 
-    async def get_user_role(self, user_id: int):
+    @staticmethod
+    def _role_stmt(user_id: int):
+        return select(UserRole.role_id).where(UserRole.user_id == user_id)
+
+    async def get_user_role(self, user_id: int, claims: Optional[dict] = None, default: Optional[int] = None):
+        """
+        Роль берётся из claims токена, иначе из кэша процесса или БД.
+        Без роли возвращается default, а если он не задан - 404.
+
+        Роль в токене переживает понижение: обновление токена копирует её из старого.
+        Поэтому claims передаются только для отображения (флаг untouchable),
+        проверки прав на запись вызывают метод без claims.
+        """
+        role_id = role_from_claims(claims)
+        if role_id is not None:
+            return role_id
+
+        cached = _role_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
         try:
-            user_role = await self.db.execute(select(UserRole).where(UserRole.user_id == user_id))
-            result = user_role.scalars().first()
-            if not result:
-                raise HTTPException(status_code=404, detail="Роль не найдена")
-            return result.role_id
+            user_role = await self.db.execute(self._role_stmt(user_id))
+            role_id = user_role.scalars().first()
         except SQLAlchemyError as e:
             raise HTTPException(status_code=400, detail=str(e))
+
+        if role_id is None:
+            if default is not None:
+                return default
+            raise HTTPException(status_code=404, detail="Роль не найдена")
+
+        _role_cache[user_id] = (time.monotonic() + settings.ROLE_CACHE_TTL_SECONDS, role_id)
+        return role_id
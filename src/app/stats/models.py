@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from sqlalchemy import Integer, DateTime, func
+from sqlalchemy.orm import mapped_column, Mapped
+
+from src.app.db.core import Base
+
+
+class TreeStats(Base):
+    """Предрасчитанные агрегаты по неудалённым потомкам узла tree"""
+    __tablename__ = "tree_stats"
+
+    tree_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    descendants: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    generations: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    living: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    dead: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    unknown: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    contributors: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=True)
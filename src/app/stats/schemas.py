@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class TreeStatsResponse(BaseModel):
+    tree_id: int = Field(..., description="ID узла", example=1)
+    descendants: int = Field(0, description="Неудалённых потомков", example=1520)
+    generations: int = Field(0, description="Поколений ниже узла", example=9)
+    living: int = Field(0, description="Живых: нет даты смерти, год рождения не старше STATS_LIFESPAN_YEARS", example=640)
+    dead: int = Field(0, description="Умерших: есть дата смерти или год рождения старше STATS_LIFESPAN_YEARS", example=700)
+    unknown: int = Field(0, description="Без дат", example=180)
+    contributors: int = Field(0, description="Разных авторов записей", example=12)
+    updated_at: Optional[datetime] = Field(None, description="Время расчёта")
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,190 @@
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import select, delete, exists, func, and_, or_, not_, true, any_, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from src.app.config.base import settings
+from src.app.stats.models import TreeStats
+from src.app.stats.schemas import TreeStatsResponse
+from src.app.tree.models import Tree
+
+# Ключи advisory-блокировок: полный пересчёт одновременно выполняет только один процесс,
+# а с инкрементальными обновлениями он идёт по очереди
+REBUILD_LOCK_KEY = 716_001
+REFRESH_LOCK_KEY = 716_002
+
+# Колонки, которые переносятся на предков разницей, и колонки, которые у предков только растут
+ADDITIVE = ("descendants", "living", "dead", "unknown")
+MONOTONIC = ("generations", "contributors")
+
+# Строк в одном INSERT разниц: 7 параметров на строку, лимит asyncpg - 32767
+DELTA_BATCH = 4000
+
+
+class StatsService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def _aggregate_stmt(self, scope: list[int] = None, upper: list[int] = None):
+        """
+        Агрегаты по потомкам одним проходом: каждый неудалённый узел раскладывается
+        по своим предкам через unnest(path), затем группировка по предку.
+        Узлы под удалёнными предками не учитываются.
+
+        С scope читаются только поддеревья узлов scope, а предки из upper (пути
+        к этим узлам) в группировку не попадают: их строки обновляет refresh разницей.
+        """
+        ancestor = func.unnest(Tree.path).table_valued("ancestor_id", with_ordinality="ord").alias("ancestor")
+        deleted = aliased(Tree)
+
+        birth_year = func.cast(func.substring(Tree.birth, r'\d{4}'), Integer)
+        oldest_living = date.today().year - settings.STATS_LIFESPAN_YEARS
+        has_death = func.coalesce(Tree.death, '') != ''
+        is_dead = or_(has_death, birth_year < oldest_living)
+        is_living = and_(not_(has_death), birth_year >= oldest_living)
+
+        stmt = (
+            select(
+                ancestor.c.ancestor_id.label("tree_id"),
+                func.count().label("descendants"),
+                # ord - позиция предка в пути, его глубина равна ord - 1
+                func.max(Tree.depth - ancestor.c.ord + 1).label("generations"),
+                func.count().filter(is_living).label("living"),
+                func.count().filter(is_dead).label("dead"),
+                func.count().filter(and_(not_(has_death), birth_year.is_(None))).label("unknown"),
+                func.count(Tree.created_by.distinct()).label("contributors"),
+            )
+            .select_from(Tree)
+            .join(ancestor, true())
+            .where(
+                Tree.is_deleted.isnot(True),
+                # Удалённый предок: проверка по первичному ключу для каждого элемента пути,
+                # без массива всех удалённых id на каждую строку
+                ~exists().where(deleted.id == any_(Tree.path), deleted.is_deleted.is_(True)),
+            )
+            .group_by(ancestor.c.ancestor_id)
+        )
+        if scope is not None:
+            stmt = stmt.where(Tree.path.overlap(scope), ancestor.c.ancestor_id.notin_(upper))
+        return stmt
+
+    async def _upsert(self, scope: list[int] = None, upper: list[int] = None):
+        columns = ["tree_id", "descendants", "generations", "living", "dead", "unknown", "contributors"]
+        stmt = pg_insert(TreeStats).from_select(columns, self._aggregate_stmt(scope, upper))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TreeStats.tree_id],
+            set_={
+                **{name: stmt.excluded[name] for name in columns[1:]},
+                "updated_at": func.now(),
+            },
+        )
+        await self.db.execute(stmt)
+
+    async def rebuild(self) -> bool:
+        """Полный пересчёт таблицы. False, если пересчёт уже идёт в другом процессе."""
+        locked = await self.db.execute(select(func.pg_try_advisory_xact_lock(REBUILD_LOCK_KEY)))
+        if not locked.scalar():
+            await self.db.rollback()
+            return False
+        await self.db.execute(select(func.pg_advisory_xact_lock(REFRESH_LOCK_KEY)))
+
+        # Читатели видят старые строки до коммита
+        await self.db.execute(delete(TreeStats))
+        await self._upsert()
+        await self.db.commit()
+        return True
+
+    async def _rows(self, node_ids: list[int]) -> dict[int, dict]:
+        result = await self.db.execute(select(TreeStats).where(TreeStats.tree_id.in_(node_ids)))
+        return {
+            row.tree_id: {name: getattr(row, name) for name in ADDITIVE + MONOTONIC}
+            for row in result.scalars().all()
+        }
+
+    async def refresh(self, node_ids: set[int]) -> int:
+        """
+        Обновление после изменений детей узлов node_ids, возвращает число пересчитанных поддеревьев.
+
+        Поддеревья верхних изменившихся узлов пересчитываются полностью, но только по своим
+        узлам. Предкам выше них прибавляется разница строки корня поддерева: descendants,
+        living, dead и unknown точно, generations и contributors только растут (GREATEST).
+        Их уменьшение и точное число авторов подбирает полный пересчёт раз в STATS_REBUILD_SECONDS.
+        """
+        if not node_ids:
+            return 0
+        # Разница считается от старых строк: обновления разных процессов идут по очереди
+        await self.db.execute(select(func.pg_advisory_xact_lock(REFRESH_LOCK_KEY)))
+
+        result = await self.db.execute(select(Tree.id, Tree.path, Tree.is_deleted).where(Tree.id.in_(node_ids)))
+        nodes = {row.id: row for row in result.all()}
+        # Корни изменений: отмеченные узлы без отмеченных предков, их поддеревья не пересекаются
+        roots = [node for node in nodes.values() if not nodes.keys() & set(node.path)]
+        if not roots:
+            await self.db.rollback()
+            return 0
+        scope = sorted(node.id for node in roots)
+        upper = sorted({ancestor_id for node in roots for ancestor_id in node.path})
+
+        # Поддерево под удалённым предком предкам не засчитывается, разницу не переносим
+        result = await self.db.execute(select(Tree.id).where(Tree.id.in_(upper), Tree.is_deleted.is_(True)))
+        deleted = set(result.scalars().all())
+        propagate = [node for node in roots if not node.is_deleted and not deleted & set(node.path)]
+        old = await self._rows([node.id for node in propagate])
+
+        # Узлы, у которых не осталось потомков, в выборку агрегата не попадут
+        subtree = select(Tree.id).where(Tree.path.overlap(scope))
+        await self.db.execute(
+            delete(TreeStats).where(or_(TreeStats.tree_id.in_(scope), TreeStats.tree_id.in_(subtree)))
+        )
+        await self._upsert(scope, upper)
+        new = await self._rows([node.id for node in propagate])
+
+        zero = dict.fromkeys(ADDITIVE + MONOTONIC, 0)
+        deltas: dict[int, dict] = {}
+        for node in propagate:
+            before, after = old.get(node.id, zero), new.get(node.id, zero)
+            for position, ancestor_id in enumerate(node.path):
+                delta = deltas.setdefault(ancestor_id, dict(zero))
+                for name in ADDITIVE:
+                    delta[name] += after[name] - before[name]
+                # Корень поддерева - потомок предка на расстоянии len(path) - position поколений
+                delta["generations"] = max(delta["generations"], after["generations"] + len(node.path) - position)
+                delta["contributors"] = max(delta["contributors"], after["contributors"])
+
+        rows = [{"tree_id": ancestor_id, **delta} for ancestor_id, delta in deltas.items()]
+        for start in range(0, len(rows), DELTA_BATCH):
+            stmt = pg_insert(TreeStats).values(rows[start:start + DELTA_BATCH])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[TreeStats.tree_id],
+                set_={
+                    **{name: getattr(TreeStats, name) + stmt.excluded[name] for name in ADDITIVE},
+                    **{name: func.greatest(getattr(TreeStats, name), stmt.excluded[name]) for name in MONOTONIC},
+                    "updated_at": func.now(),
+                },
+            )
+            await self.db.execute(stmt)
+
+        await self.db.commit()
+        return len(roots)
+
+    async def is_empty(self) -> bool:
+        result = await self.db.execute(select(TreeStats.tree_id).limit(1))
+        return result.first() is None
+
+    async def get_node_stats(self, node_id: int):
+        result = await self.db.execute(
+            select(Tree.is_deleted, TreeStats)
+            .outerjoin(TreeStats, TreeStats.tree_id == Tree.id)
+            .where(Tree.id == node_id)
+        )
+        row = result.first()
+        if not row or row.is_deleted:
+            raise HTTPException(status_code=404, detail='Node not found')
+
+        if row.TreeStats is None:
+            # Листья и узлы, ещё не попавшие в пересчёт
+            return TreeStatsResponse(tree_id=node_id).model_dump(mode="json")
+        return TreeStatsResponse.model_validate(row.TreeStats).model_dump(mode="json")
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.params import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.app.db.core import get_db
+from src.app.config.auth import auth
+from src.app.config.response import StandardResponse, autowrap
+from src.app.role.service import RoleService
+from .schemas import TreeStatsResponse
+from .service import StatsService
+
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+@router.get('/{node_id}', response_model=StandardResponse[TreeStatsResponse])
+@autowrap
+async def get_node_stats(node_id: int, db: AsyncSession = Depends(get_db)):
+    service = StatsService(db)
+    return await service.get_node_stats(node_id)
+
+@router.post('/rebuild', response_model=StandardResponse[dict])
+@autowrap
+async def rebuild_stats(user_data = Depends(auth.get_user_data_dependency()), db: AsyncSession = Depends(get_db)):
+    user_role = await RoleService(db).get_user_role(int(user_data["sub"]))
+    if user_role != 3:
+        raise HTTPException(status_code=403, detail="У вас нет прав на пересчёт статистики")
+    service = StatsService(db)
+    return {"rebuilt": await service.rebuild()}
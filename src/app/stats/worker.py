@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from typing import Iterable
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory
+from src.app.stats.service import StatsService
+
+
+class StatsWorker:
+    """
+    Фоновое обновление tree_stats.
+
+    Изменения дерева только отмечают узлы, чьи дети изменились. Раз в refresh_seconds
+    пересчитываются их поддеревья, предкам переносится разница. Раз в rebuild_seconds
+    таблица строится заново: это подбирает правки из других процессов
+    (краулер, ручные изменения в БД).
+    """
+
+    def __init__(self, refresh_seconds: float, rebuild_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._dirty: set[int] = set()
+        self._last_rebuild = 0.0
+        self._task = None
+
+    def mark_dirty(self, node_ids: Iterable[int]):
+        self._dirty.update(node_ids)
+
+    async def _rebuild(self):
+        async with async_session_factory() as db:
+            if await StatsService(db).rebuild():
+                logging.info("Статистика дерева пересчитана полностью")
+        self._last_rebuild = time.monotonic()
+
+    async def _refresh(self):
+        node_ids, self._dirty = self._dirty, set()
+        try:
+            async with async_session_factory() as db:
+                await StatsService(db).refresh(node_ids)
+        except Exception:
+            # Вернём узлы, чтобы попробовать в следующий раз
+            self._dirty.update(node_ids)
+            raise
+
+    async def _run(self):
+        try:
+            async with async_session_factory() as db:
+                empty = await StatsService(db).is_empty()
+            if empty:
+                await self._rebuild()
+            else:
+                self._last_rebuild = time.monotonic()
+        except Exception as e:
+            logging.error(f"Ошибка при построении статистики дерева: {e}")
+
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                if time.monotonic() - self._last_rebuild >= self.rebuild_seconds:
+                    # Полный пересчёт покрывает и отмеченные узлы
+                    self._dirty = set()
+                    await self._rebuild()
+                elif self._dirty:
+                    await self._refresh()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении статистики дерева: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+stats_worker = StatsWorker(
+    refresh_seconds=settings.STATS_REFRESH_SECONDS,
+    rebuild_seconds=settings.STATS_REBUILD_SECONDS,
+)
@@ -29,7 +29,7 @@ class UserTariff(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
     tariff_id: Mapped[int] = mapped_column(Integer, nullable=False)
 
     t_add_child: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
@@ -22,7 +22,7 @@ class Ticket(Base):
     ticket_type: Mapped[str] = mapped_column(SQLEnum(TicketType), nullable=False)
     status: Mapped[str] = mapped_column(SQLEnum(TicketStatus), nullable=False)
 
-    created_by: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_by: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
     answered_by: Mapped[int] = mapped_column(Integer, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=True)
@@ -34,7 +34,7 @@ class TicketAddData(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    ticket_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    ticket_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     parent_id: Mapped[int] = mapped_column(Integer, nullable=False)
 
@@ -48,7 +48,7 @@ class TicketEditData(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    ticket_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    ticket_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     tree_id: Mapped[int] = mapped_column(Integer, nullable=False)
 
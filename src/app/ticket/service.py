@@ -3,6 +3,7 @@ from src.app.ticket.schemas import *
 from src.app.role.service import RoleService
 from src.app.tariff.service import TariffService
 from src.app.tree.models import Tree
+from src.app.tree.service import TreeService
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi import HTTPException
@@ -12,6 +13,7 @@ class TicketService:
         self.db = db
         self.role_service = RoleService(db)
         self.tariff_service = TariffService(db) 
+        self.tree_service = TreeService(db)
 
     async def _set_edit_data(self, ticket_id: int) -> bool:
         try:
@@ -43,6 +45,12 @@ class TicketService:
                 tree.birth = result.new_birth
             if result.new_death:
                 tree.death = result.new_death
+            if tree.t_id and (result.new_name or result.new_birth or result.new_death):
+                # Правка узла из tumalas: следующая синхронизация не должна её откатить
+                tree.t_override = True
+            self.tree_service._touch_children(tree.parent_id)
+            # У корня родителя нет: отмечаем сам узел, чтобы сбросить родословные с его именем
+            self.tree_service._touch_children(tree.id, stats=False)
 
             
             await self.tariff_service._change_edit_count(ticket.created_by)
@@ -67,8 +75,10 @@ class TicketService:
             
             print(f"Found {len(result)} items to add")
             
+            added = {}
             for item in result:
                 print(f"Adding new tree item: {item.__dict__}")
+                path = await self.tree_service._child_path(item.parent_id)
                 new_data = Tree(
                     name=item.name,
                     birth=None,
@@ -76,10 +86,15 @@ class TicketService:
                     bio=None,
                     is_deleted=False,
                     t_id=0,
-                    parent_id=item.parent_id
+                    parent_id=item.parent_id,
+                    path=path,
+                    depth=len(path)
                 )
                 self.db.add(new_data)
                 await self.db.flush()
+                added[item.parent_id] = added.get(item.parent_id, 0) + 1
+
+            await self.tree_service._shift_counts({parent_id: (count, count) for parent_id, count in added.items()})
             
             await self.tariff_service._change_add_count(ticket.created_by, len(result))
             print("Successfully added all items")
@@ -327,6 +342,7 @@ class TicketService:
                     print(f"Edit data result: {result}")
             
             await self.db.commit()
+            self.tree_service._publish_children()
             await self.db.refresh(ticket)
             
             return TicketResponse(
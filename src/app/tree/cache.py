@@ -0,0 +1,131 @@
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+from src.app.config.base import settings
+
+
+class ChildrenCache:
+    """
+    Кэш списков детей узла в памяти процесса: TTL и вытеснение давно не читанных записей.
+
+    Загрузка из БД может разминуться с инвалидацией, поэтому перед загрузкой берётся
+    версия ключа, и set() не сохраняет результат, если ключ успели инвалидировать.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[float, list[dict]]] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, node_id: int):
+        entry = self._entries.get(node_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[node_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(node_id)
+        self.hits += 1
+        return entry[1]
+
+    def version(self, node_id: int) -> tuple[int, int]:
+        return self._epoch, self._versions.get(node_id, 0)
+
+    def set(self, node_id: int, value: list[dict], version: tuple[int, int]):
+        if self.version(node_id) != version:
+            return
+
+        self._entries[node_id] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(node_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, node_ids: Iterable[int]):
+        for node_id in node_ids:
+            self._entries.pop(node_id, None)
+            self._versions[node_id] = self._versions.get(node_id, 0) + 1
+            self.invalidations += 1
+        # Версии нужны только на время загрузки: при сбросе словаря меняется эпоха,
+        # и все незавершённые загрузки просто не попадут в кэш
+        if len(self._versions) > self.max_entries:
+            self._versions = {}
+            self._epoch += 1
+
+    def clear(self):
+        # Смена эпохи отбрасывает и загрузки, начатые до сброса, даже по ключам не из кэша
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._versions = {}
+        self._epoch += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class DependentCache(ChildrenCache):
+    """
+    Кэш записей, собранных из списков детей нескольких узлов: родословные
+    (pedigree_cache), ключ - (id узла, число поколений).
+
+    set() запоминает, детей каких узлов прочитала запись, invalidate(ids) сбрасывает
+    все записи, зависящие от этих узлов. Обратный индекс знает только сохранённые
+    записи, поэтому любая инвалидация меняет поколение, и загрузки, начатые до неё,
+    в кэш не попадают.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__(ttl, max_entries)
+        self._dependents: dict[int, set] = {}
+        self._generation = 0
+
+    def version(self, key) -> tuple[int, int, int]:
+        return (*super().version(key), self._generation)
+
+    def set(self, key, value, version, depends_on: Iterable[int] = ()):
+        super().set(key, value, version)
+        if key not in self._entries:
+            return
+        for node_id in depends_on:
+            self._dependents.setdefault(node_id, set()).add(key)
+        # Вытесненные записи остаются в обратном индексе, не даём ему расти без конца
+        if len(self._dependents) > self.max_entries * 50:
+            self.clear()
+
+    def invalidate(self, node_ids: Iterable[int]):
+        self._generation += 1
+        keys = set()
+        for node_id in node_ids:
+            keys.update(self._dependents.pop(node_id, ()))
+        super().invalidate(keys)
+
+    def clear(self):
+        super().clear()
+        self._dependents = {}
+        self._generation += 1
+
+
+children_cache = ChildrenCache(
+    ttl=settings.TREE_CHILDREN_CACHE_TTL_SECONDS,
+    max_entries=settings.TREE_CHILDREN_CACHE_MAX_ENTRIES,
+)
+
+pedigree_cache = DependentCache(
+    ttl=settings.TREE_PEDIGREE_CACHE_TTL_SECONDS,
+    max_entries=settings.TREE_PEDIGREE_CACHE_MAX_ENTRIES,
+)
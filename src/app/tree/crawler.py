@@ -0,0 +1,241 @@
+"""
+Массовая выгрузка поддерева tumalas.kz в таблицу tree.
+
+Обходит поддерево в ширину, начиная с уже импортированного узла,
+с ограничением параллельности и частоты запросов. Фронт обхода
+сохраняется в файл после каждой пачки, повторный запуск с тем же
+--checkpoint продолжает с места остановки. После завершения обхода
+файл удаляется, и та же команда запускает новый обход.
+
+    python -m src.app.tree.crawler --node-id 25 --checkpoint crawl-25.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import select, update, func
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory, async_engine
+from src.app.tree.models import Tree
+from src.app.tree.service import TreeService
+from src.app.tree.tumalas import TumalasClient, CircuitBreaker, CircuitOpenError
+
+
+class RateLimiter:
+    """Не больше rate запросов в секунду на все корутины"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(loop.time(), self._next) + self.interval
+
+
+class TumalasCrawler:
+    def __init__(
+        self,
+        client: TumalasClient,
+        checkpoint: str,
+        concurrency: int = 4,
+        rps: float = 5,
+        batch_size: int = 200,
+        max_depth: Optional[int] = None,
+    ):
+        self.client = client
+        self.checkpoint = checkpoint
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rps)
+        self.batch_size = batch_size
+        self.max_depth = max_depth
+
+        # Элемент фронта: [id узла, t_id, path узла]
+        self.frontier: list[list] = []
+        self.failed: list[list] = []
+        self.root_id: Optional[int] = None
+        self.root_depth = 0
+        self.stats = {"fetched": 0, "imported": 0, "updated": 0, "unchanged": 0, "failed": 0}
+
+    def load_checkpoint(self) -> bool:
+        if not os.path.exists(self.checkpoint):
+            return False
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        # Ранее упавшие узлы пробуем снова
+        self.frontier = state["frontier"] + state["failed"]
+        self.root_id = state.get("root_id")
+        self.root_depth = state["root_depth"]
+        self.stats.update(state["stats"])
+        return True
+
+    def save_checkpoint(self):
+        state = {
+            "frontier": self.frontier,
+            "failed": self.failed,
+            "root_id": self.root_id,
+            "root_depth": self.root_depth,
+            "stats": self.stats,
+        }
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint)
+
+    async def start_from(self, node_id: int):
+        async with async_session_factory() as db:
+            node = await db.get(Tree, node_id)
+            if node is None or not node.t_id:
+                raise SystemExit(f"Узел {node_id} не найден или не связан с tumalas")
+            self.frontier = [[node.id, node.t_id, list(node.path)]]
+            self.root_id = node.id
+            self.root_depth = node.depth
+
+    async def _wait_breaker(self):
+        """Пока предохранитель открыт, ждём пробного запроса, а не проваливаем узлы мгновенно"""
+        breaker = self.client.breaker
+        while breaker.opened_at is not None:
+            remaining = breaker.reset_timeout - (time.monotonic() - breaker.opened_at)
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    async def _fetch(self, entry: list):
+        async with self.semaphore:
+            while True:
+                await self._wait_breaker()
+                await self.limiter.wait()
+                try:
+                    return entry, await self.client.get_children(entry[1])
+                except CircuitOpenError:
+                    # Пробный запрос уже ушёл из другой корутины, ждём его результата
+                    continue
+                except Exception as e:
+                    logging.warning(f"Не удалось получить детей узла {entry[0]}: {e}")
+                    return entry, None
+
+    async def _process_batch(self, batch: list[list]) -> list[list]:
+        results = await asyncio.gather(*(self._fetch(entry) for entry in batch))
+
+        async with async_session_factory() as db:
+            service = TreeService(db)
+            rows = {}
+            synced_ids = []
+            for (node_id, t_id, path), data in results:
+                if data is None:
+                    self.failed.append([node_id, t_id, path])
+                    self.stats["failed"] += 1
+                    continue
+                child_path = [*path, node_id]
+                for item in data:
+                    row = service._tumalas_row(item, node_id, child_path)
+                    rows.setdefault(row["t_id"], row)
+                synced_ids.append(node_id)
+
+            report = await service._upsert_tumalas_rows(list(rows.values()))
+            await db.execute(
+                update(Tree)
+                .where(Tree.id.in_(synced_ids))
+                .values(last_synced_at=func.now(), updated_at=Tree.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+
+            # Следующий уровень берём из БД: там и новые, и ранее импортированные узлы
+            next_level = []
+            if rows:
+                result = await db.execute(
+                    select(Tree.id, Tree.t_id, Tree.path)
+                    .where(Tree.t_id.in_(rows.keys()), Tree.t_id > 0, Tree.is_deleted.isnot(True))
+                )
+                next_level = [
+                    [row.id, row.t_id, list(row.path)]
+                    for row in result.all()
+                    if self.max_depth is None or len(row.path) - self.root_depth < self.max_depth
+                ]
+            await db.commit()
+
+        self.stats["fetched"] += len(synced_ids)
+        self.stats["imported"] += len(report["inserted"])
+        self.stats["updated"] += report["updated"]
+        self.stats["unchanged"] += report["unchanged"]
+        return next_level
+
+    async def run(self):
+        while self.frontier:
+            batch, self.frontier = self.frontier[:self.batch_size], self.frontier[self.batch_size:]
+            next_level = await self._process_batch(batch)
+            # В конец очереди: обход остаётся в ширину
+            self.frontier.extend(next_level)
+            self.save_checkpoint()
+            logging.info(
+                f"Опрошено {self.stats['fetched']}, добавлено {self.stats['imported']}, "
+                f"обновлено {self.stats['updated']}, без изменений {self.stats['unchanged']}, "
+                f"ошибок {self.stats['failed']}, во фронте {len(self.frontier)}"
+            )
+        if self.failed:
+            # Упавшие узлы остаются в файле: повторный запуск попробует их снова
+            logging.warning(f"Не опрошено {len(self.failed)} узлов, состояние сохранено в {self.checkpoint}")
+        else:
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+        return self.stats
+
+
+async def main(args):
+    client = TumalasClient(
+        base_url=args.base_url,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.TUMALAS_BREAKER_THRESHOLD,
+            reset_timeout=settings.TUMALAS_BREAKER_RESET_SECONDS,
+        ),
+    )
+    crawler = TumalasCrawler(
+        client,
+        checkpoint=args.checkpoint,
+        concurrency=args.concurrency,
+        rps=args.rps,
+        batch_size=args.batch_size,
+        max_depth=args.max_depth,
+    )
+    try:
+        if crawler.load_checkpoint():
+            if args.node_id is not None and crawler.root_id is not None and args.node_id != crawler.root_id:
+                raise SystemExit(
+                    f"{args.checkpoint} принадлежит обходу узла {crawler.root_id}, а не {args.node_id}"
+                )
+            logging.info(f"Продолжаем обход из {args.checkpoint}: во фронте {len(crawler.frontier)} узлов")
+        else:
+            await crawler.start_from(args.node_id)
+        stats = await crawler.run()
+        logging.info(f"Обход завершён: {stats}")
+    finally:
+        await client.close()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--node-id", type=int, help="id узла в нашей БД, с которого начинается обход")
+    parser.add_argument("--checkpoint", required=True, help="Файл состояния обхода")
+    parser.add_argument("--concurrency", type=int, default=4, help="Одновременных запросов к tumalas")
+    parser.add_argument("--rps", type=float, default=5, help="Запросов в секунду к tumalas")
+    parser.add_argument("--batch-size", type=int, default=200, help="Узлов фронта на одну запись в БД")
+    parser.add_argument("--max-depth", type=int, default=None, help="Сколько поколений ниже стартового узла обходить")
+    parser.add_argument("--base-url", default=settings.TUMALAS_BASE_URL, help="Адрес API tumalas (например, локальный фейковый сервер)")
+    args = parser.parse_args()
+
+    if args.node_id is None and not os.path.exists(args.checkpoint):
+        parser.error("--node-id обязателен для нового обхода")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(args))
@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import Text, func, Integer
+from sqlalchemy import Text, String, func, Integer, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.app.db.core import Base
@@ -8,6 +9,16 @@ from src.app.db.core import Base
 
 class Tree(Base):
     __tablename__ = 'tree'
+    __table_args__ = (
+        Index('ix_tree_path', 'path', postgresql_using='gin'),
+        Index('ux_tree_t_id', 't_id', unique=True, postgresql_where=text('t_id > 0')),
+        Index('ix_tree_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Список детей: условие совпадает с фильтром Tree.is_deleted.isnot(True) в запросах
+        Index('ix_tree_parent_id_alive', 'parent_id', 'id', postgresql_where=text('is_deleted IS NOT TRUE')),
+        Index('ix_tree_created_by', 'created_by'),
+        # Догрузка изменений индексом подсказок и снимком дерева
+        Index('ix_tree_updated_at', 'updated_at'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -23,8 +34,21 @@ class Tree(Base):
     updated_by: Mapped[int] = mapped_column(nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(nullable=True, server_default=func.now())
-    updated_at: Mapped[datetime] = mapped_column(nullable=True, server_default=func.now(), server_onupdate=func.now())
+    updated_at: Mapped[datetime] = mapped_column(nullable=True, server_default=func.now(), onupdate=func.now(), server_onupdate=func.now())
 
     is_deleted: Mapped[bool] = mapped_column(nullable=True, default=False)
     t_id: Mapped[int] = mapped_column(nullable=True)
+    last_synced_at: Mapped[datetime] = mapped_column(nullable=True)
+    # md5 последнего загруженного из tumalas содержимого (имя, годы), см. tumalas_hash
+    t_hash: Mapped[str] = mapped_column(String(32), nullable=True)
+    # Имя или годы исправлены одобренным тикетом: обновления из tumalas их не перезаписывают
+    t_override: Mapped[bool] = mapped_column(nullable=False, default=False, server_default='false')
     parent_id: Mapped[int] = mapped_column(Integer, nullable=True)
+
+    # Материализованный путь: id предков от корня до родителя, depth = длина пути
+    path: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False, server_default='{}')
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+
+    # Денормализованные счётчики по неудалённым узлам, пересчёт: python -m src.app.tree.repair
+    child_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    descendant_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory, async_engine
+from src.app.tree.models import Tree
+from src.app.tree.cache import children_cache
+from src.app.tree.singleflight import tree_flight
+from src.app.tree.tumalas import TumalasClient, CircuitBreaker, tumalas_client
+
+
+class TreePrefetcher:
+    """
+    Упреждающая загрузка следующего уровня дерева.
+
+    После раскрытия узла его дети ставятся в очередь: воркеры импортируют
+    их детей из tumalas (если узел ни разу не синхронизировался) и прогревают
+    children_cache. Число воркеров - общий бюджет на все запросы, очередь
+    ограничена и при переполнении задачи отбрасываются, повторно узел не ставится.
+    Узел, который пользователь успел раскрыть сам, из очереди пропускается.
+
+    С пользовательскими запросами загрузка не конкурирует: у неё свой небольшой
+    пул соединений к tumalas и свой предохранитель, а пока занят базовый пул
+    соединений к БД, задачи пропускаются.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_children: int, window: float):
+        self.workers = workers
+        self.max_children = max_children
+        self.window = window
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pending: set[int] = set()
+        self._claimed: set[int] = set()
+        # id прогретых узлов -> время прогрева, для подсчёта попаданий
+        self._warmed: OrderedDict[int, float] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+        self.client = TumalasClient(
+            base_url=settings.TUMALAS_BASE_URL,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.TUMALAS_BREAKER_THRESHOLD,
+                reset_timeout=settings.TUMALAS_BREAKER_RESET_SECONDS,
+            ),
+            max_connections=settings.TREE_PREFETCH_MAX_CONNECTIONS,
+        )
+
+        self.scheduled = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.busy = 0
+        self.warmed = 0
+        self.hits = 0
+        self.expansions = 0
+
+    def claim(self, node_id: int):
+        """Вызывается при раскрытии узла пользователем"""
+        self.expansions += 1
+        warmed_at = self._warmed.pop(node_id, None)
+        if warmed_at is not None and time.monotonic() - warmed_at <= self.window:
+            self.hits += 1
+        if node_id in self._pending:
+            self._claimed.add(node_id)
+
+    def schedule(self, node_ids: list[int]):
+        for node_id in node_ids[:self.max_children]:
+            if node_id in self._pending or node_id in self._warmed:
+                continue
+            try:
+                self._queue.put_nowait(node_id)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                return
+            self._pending.add(node_id)
+            self.scheduled += 1
+
+    async def _prefetch(self, node_id: int):
+        # Импорт здесь: сервис сам ставит узлы в эту очередь
+        from src.app.tree.service import TreeService
+
+        async with async_session_factory() as db:
+            result = await db.execute(
+                select(Tree.t_id, Tree.last_synced_at, Tree.is_deleted).where(Tree.id == node_id)
+            )
+            node = result.first()
+        # Сессия закрыта до ожидания общих вычислений: они берут свои соединения,
+        # так что воркер держит не больше одного соединения за раз
+        if node is None or node.is_deleted:
+            return
+        # tumalas не трогаем, пока открыт любой из предохранителей
+        upstream_ok = self.client.breaker.opened_at is None and tumalas_client.breaker.opened_at is None
+        if node.t_id and node.last_synced_at is None and upstream_ok:
+            await TreeService.sync_children_shared(node_id, node.t_id, self.client)
+        # Загрузчик сам открывает сессию; через tree_flight, чтобы не дублировать запрос клиента
+        if children_cache.get(node_id) is None:
+            await tree_flight.do(("children", node_id), lambda: TreeService._load_children(node_id))
+
+        self._warmed[node_id] = time.monotonic()
+        while len(self._warmed) > self._queue.maxsize * 4:
+            self._warmed.popitem(last=False)
+        self.warmed += 1
+
+    async def _worker(self):
+        while True:
+            node_id = await self._queue.get()
+            try:
+                if node_id in self._claimed:
+                    self.skipped += 1
+                elif async_engine.pool.checkedout() >= async_engine.pool.size():
+                    # Базовый пул занят пользовательскими запросами
+                    self.busy += 1
+                else:
+                    await self._prefetch(node_id)
+            except Exception as e:
+                logging.error(f"Ошибка упреждающей загрузки узла {node_id}: {e}")
+            finally:
+                self._pending.discard(node_id)
+                self._claimed.discard(node_id)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "busy": self.busy,
+            "warmed": self.warmed,
+            "hits": self.hits,
+            "expansions": self.expansions,
+            # Доля прогретых узлов, которые потом раскрыли
+            "hit_rate": round(self.hits / self.warmed, 4) if self.warmed else 0.0,
+        }
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.client.close()
+
+
+tree_prefetch = TreePrefetcher(
+    workers=settings.TREE_PREFETCH_WORKERS,
+    queue_size=settings.TREE_PREFETCH_QUEUE_SIZE,
+    max_children=settings.TREE_PREFETCH_MAX_CHILDREN,
+    window=settings.TREE_PREFETCH_WINDOW_SECONDS,
+)
@@ -0,0 +1,32 @@
+"""
+Пересчёт child_count и descendant_count в таблице tree.
+
+Нужен после ручных правок в БД или если счётчики разошлись с данными.
+Без --node-id пересчитывается всё дерево.
+
+    python -m src.app.tree.repair --node-id 25
+"""
+import argparse
+import asyncio
+import logging
+
+from src.app.db.core import async_session_factory, async_engine
+from src.app.tree.service import TreeService
+
+
+async def main(node_id: int = None):
+    try:
+        async with async_session_factory() as db:
+            levels = await TreeService(db).recount_tree(node_id)
+        logging.info(f"Счётчики пересчитаны, поколений: {levels}")
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--node-id", type=int, default=None, help="Пересчитать только поддерево этого узла")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(args.node_id))
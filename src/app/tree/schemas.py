@@ -27,4 +27,12 @@ class TreeResponse(BaseTree):
 
 class SearchTree(BaseModel):
     name: str
-    parent_id: int
\ No newline at end of file
+    parent_id: int
+    limit: int = Field(50, ge=1, le=200, description="Размер страницы")
+    after: Optional[int] = Field(None, description="ID последней записи предыдущей страницы (только для точного поиска)")
+    fuzzy: bool = Field(False, description="Нечеткий поиск с ранжированием по похожести")
+    min_similarity: float = Field(0.3, ge=0, le=1, description="Минимальная похожесть для нечеткого поиска")
+
+
+class TreeBatch(BaseModel):
+    ids: list[int] = Field(..., min_length=1, max_length=300, description="ID узлов")
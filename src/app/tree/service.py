@@ -1,188 +1,877 @@
+import bisect
+from collections import defaultdict
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Optional
+
 from fastapi import HTTPException
-import requests
 import logging
-from sqlalchemy import select
+from sqlalchemy import select, update, exists, func, literal, literal_column, any_, text, and_, or_, case, cast, bindparam, Integer, Interval
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from src.app.auth.models import User
+from src.app.db.core import async_session_factory
 from src.app.tree.models import Tree
-from src.app.role.models import UserRole
+from src.app.role.service import RoleService
+from src.app.stats.worker import stats_worker
+from src.app.tree.cache import children_cache, pedigree_cache
+from src.app.tree.prefetch import tree_prefetch
+from src.app.tree.singleflight import tree_flight
+from src.app.tree.snapshot import tree_snapshot
+from src.app.tree.suggest import suggest_index
+from src.app.tree.tumalas import TumalasClient, tumalas_client, tumalas_hash, CircuitOpenError
+from src.app.tree.sync import tree_sync
+from src.app.config.base import settings
+
+# Узлов в одном INSERT: 10 параметров на строку, лимит asyncpg - 32767
+TUMALAS_INSERT_BATCH = 2000
 
 
 class TreeService:
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.base_url = 'https://tumalas.kz/wp-admin/admin-ajax.php?action=tuma_cached_childnew_get&nodeid=14&id='
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
+        # Узлы, чьи списки детей изменились в текущей транзакции
+        self._changed_children: set[int] = set()
+        # Из них узлы, под которыми изменились сами потомки, а не только счётчики
+        self._changed_stats: set[int] = set()
+
+    def _touch_children(self, *parent_ids: int, stats: bool = True):
+        """
+        Отмечает списки детей, которые нужно сбросить из кэша после коммита.
+        stats=False - у узлов поменялись только счётчики (предки изменения),
+        статистика переносит на них разницу сама.
+        """
+        parent_ids = [parent_id for parent_id in parent_ids if parent_id is not None]
+        self._changed_children.update(parent_ids)
+        if stats:
+            self._changed_stats.update(parent_ids)
+
+    def _publish_children(self):
+        """Сбрасывает отмеченные списки детей и ставит их узлы на пересчёт статистики, вызывается после коммита"""
+        if self._changed_children:
+            children_cache.invalidate(self._changed_children)
+            # Родословные, в которых эти узлы родители: изменились братья, имена или удаления
+            pedigree_cache.invalidate(self._changed_children)
+            stats_worker.mark_dirty(self._changed_stats)
+            tree_snapshot.touch()
+            self._changed_children = set()
+            self._changed_stats = set()
+
+    def _tumalas_row(self, item: dict, parent_id: int, path: list[int]) -> dict:
+        """Строка таблицы tree для узла из ответа tumalas"""
+        row = {
+            "name": item['name'],
+            "birth": item['birth_year'] if item['birth_year'] not in [None, 0] else None,
+            "death": item['death_year'] if item['death_year'] not in [None, 0] else None,
+            "parent_id": parent_id,
+            "is_deleted": False,
+            "t_id": int(item['id']),
+            "path": path,
+            "depth": len(path),
         }
+        row["t_hash"] = tumalas_hash(row["name"], row["birth"], row["death"])
+        return row
 
-    async def get_tree_on_api(self, id: int, parent_id: int):
-        url = f'{self.base_url}&id={id}'
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
-
-            new_nodes = []
-            for item in data:
-                t_id = int(item['id'])
-
-                # Проверяем, существует ли запись с таким t_id
-                existing_node = await self.db.execute(select(Tree).where(Tree.t_id == t_id))
-                if existing_node.scalars().first():
-                    continue  # Пропускаем, если уже есть в БД
-
-                new_node = Tree(
-                    name=item['name'],
-                    birth=item['birth_year'] if item['birth_year'] not in [None, 0] else None,
-                    death=item['death_year'] if item['death_year'] not in [None, 0] else None,
-                    parent_id=parent_id,
-                    is_deleted=False,
-                    t_id=t_id
-                )
+    @staticmethod
+    def _tumalas_hashes_stmt(t_ids: list[int]):
+        """Сохранённые хэши узлов tumalas, по индексу ux_tree_t_id"""
+        return select(Tree.t_id, Tree.t_hash, Tree.t_override).where(Tree.t_id.in_(t_ids), Tree.t_id > 0)
+
+    async def _upsert_tumalas_rows(self, rows: list[dict]) -> dict:
+        """
+        Импорт узлов tumalas с обновлением уже загруженных.
+
+        Хэши содержимого сверяются одним запросом, в INSERT ... ON CONFLICT (t_id) DO UPDATE
+        уходят только новые и изменившиеся строки. Родитель и путь существующих узлов
+        не меняются. Узлы без сохранённого хэша и узлы с одобренными правками (t_override)
+        сохраняют локальные данные, у них записывается только хэш.
+        Возвращает id добавленных узлов и число обновлённых и неизменных.
+        """
+        # Повторы t_id в одном INSERT ... DO UPDATE недопустимы
+        rows = list({row["t_id"]: row for row in rows}.values())
+        stored = {}
+        keep_local = set()
+        t_ids = [row["t_id"] for row in rows]
+        for start in range(0, len(t_ids), TUMALAS_INSERT_BATCH):
+            result = await self.db.execute(self._tumalas_hashes_stmt(t_ids[start:start + TUMALAS_INSERT_BATCH]))
+            for t_id, t_hash, t_override in result.all():
+                stored[t_id] = t_hash
+                if t_hash is None or t_override:
+                    keep_local.add(t_id)
 
-                self.db.add(new_node)
-                new_nodes.append(new_node)
+        pending = [row for row in rows if row["t_id"] not in stored or stored[row["t_id"]] != row["t_hash"]]
+        report = {"inserted": [], "updated": 0, "unchanged": len(rows) - len(pending)}
 
-            if new_nodes:
-                await self.db.commit()
-            return new_nodes  # Возвращаем список добавленных узлов (может быть пустым)
+        # Содержимое из tumalas применяется, только если хэш уже был и правок нет
+        overwrite = and_(Tree.t_hash.isnot(None), Tree.t_override.isnot(True))
 
+        added = defaultdict(int)
+        for start in range(0, len(pending), TUMALAS_INSERT_BATCH):
+            stmt = pg_insert(Tree).values(pending[start:start + TUMALAS_INSERT_BATCH])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Tree.t_id],
+                index_where=text('t_id > 0'),
+                set_={
+                    "name": case((overwrite, stmt.excluded.name), else_=Tree.name),
+                    "birth": case((overwrite, stmt.excluded.birth), else_=Tree.birth),
+                    "death": case((overwrite, stmt.excluded.death), else_=Tree.death),
+                    "t_hash": stmt.excluded.t_hash,
+                    "updated_at": case((overwrite, func.now()), else_=Tree.updated_at),
+                },
+                # Параллельный импорт мог уже записать то же содержимое
+                where=Tree.t_hash.is_distinct_from(stmt.excluded.t_hash),
+            )
+            # xmax = 0 только у строк, вставленных этим запросом
+            result = await self.db.execute(
+                stmt.returning(Tree.id, Tree.parent_id, Tree.t_id, literal_column("xmax = 0").label("inserted"))
+            )
+            for row in result.all():
+                if row.inserted:
+                    report["inserted"].append(row.id)
+                    added[row.parent_id] += 1
+                elif row.t_id in keep_local:
+                    report["unchanged"] += 1
+                else:
+                    report["updated"] += 1
+                    self._touch_children(row.parent_id)
+
+        await self._shift_counts({parent_id: (count, count) for parent_id, count in added.items()})
+        return report
+
+    async def get_tree_on_api(self, id: int, parent_id: int, client: TumalasClient = None):
+        try:
+            data = await (client or tumalas_client).get_children(id)
+            if not data:
+                return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+            path = await self._child_path(parent_id)
+            report = await self._upsert_tumalas_rows(
+                [self._tumalas_row(item, parent_id, path) for item in data]
+            )
+            await self.db.commit()
+            self._publish_children()
+            # Счётчики добавленных, обновлённых и неизменных узлов
+            return {**report, "inserted": len(report["inserted"])}
+
+        except CircuitOpenError as e:
+            logging.warning(str(e))
+            return None  # tumalas недоступен, отдаем то, что уже есть в БД
         except Exception as e:
             logging.error(f"Ошибка при запросе дерева: {e}")
+            await self.db.rollback()
+            self._changed_children = set()
+            self._changed_stats = set()
             return None  # Возвращаем None, если ошибка
 
-    async def get_tree_on_db(self, node_id: int, user_id: int):
-        result = await self.db.execute(select(Tree).where(Tree.id == node_id))
-        node = result.scalars().first()
+    async def sync_children(self, node_id: int, t_id: int, client: TumalasClient = None) -> bool:
+        """Импортирует детей узла из tumalas и отмечает время синхронизации"""
+        imported = await self.get_tree_on_api(t_id, node_id, client)
+        if imported is None:
+            return False
+
+        # updated_at не трогаем: он отражает изменения самих данных узла
+        await self.db.execute(
+            update(Tree)
+            .where(Tree.id == node_id)
+            .values(last_synced_at=func.now(), updated_at=Tree.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        return True
+
+    @staticmethod
+    async def sync_children_shared(node_id: int, t_id: int, client: TumalasClient = None) -> bool:
+        """
+        sync_children с объединением одновременных запросов одного узла:
+        tumalas опрашивается один раз, остальные ждут тот же результат
+        """
+        async def run():
+            async with async_session_factory() as db:
+                return await TreeService(db).sync_children(node_id, t_id, client)
+
+        return await tree_flight.do(("sync", node_id), run)
+
+    async def get_tree_on_db(self, node_id: int, user_id: int, claims: dict = None, after: int = None, limit: int = None):
+        """
+        Дети узла. Без limit - весь список, с limit - страница детей с id больше after
+        и курсор next_after для следующей страницы (None на последней).
+        """
+        # Устаревание считаем в БД: last_synced_at пишется её now(), часы приложения
+        # и часовой пояс могут отличаться
+        ttl = timedelta(seconds=settings.TUMALAS_SYNC_TTL_SECONDS)
+        result = await self.db.execute(
+            select(
+                Tree.id,
+                Tree.t_id,
+                Tree.last_synced_at,
+                (Tree.last_synced_at < func.now() - cast(ttl, Interval)).label('stale'),
+            )
+            .where(Tree.id == node_id)
+        )
+        node = result.first()
         if not node:
             raise HTTPException(status_code=404, detail='Node not found')
+        tree_prefetch.claim(node_id)
+
+        # Список детей один на всех пользователей, флаг untouchable зависит от роли
+        # и добавляется уже после кэша
+        role_id = await RoleService(self.db).get_user_role(user_id, claims, default=1)
+        untouchable = True if role_id >= 2 else False
 
-        # Проверяем, нет ли новых данных в API
-        await self.get_tree_on_api(node.t_id, node_id)
+        # Синхронизация и выборка детей общие для одновременных запросов и идут в своих
+        # сессиях. Соединение запроса возвращаем в пул до ожидания: иначе при всплеске
+        # ожидающие займут весь пул и общей задаче не хватит соединения.
+        await self.db.commit()
 
-        # После запроса к API делаем повторный запрос в БД (на случай обновлений)
-        result = await self.db.execute(select(Tree).where(Tree.parent_id == node_id).order_by(Tree.id))
-        childs = result.scalars().all()
+        # Дети отдаются из БД. tumalas опрашивается синхронно только для ни разу
+        # не синхронизированного узла, устаревшие узлы обновляются в фоне.
+        if node.t_id:
+            if node.last_synced_at is None:
+                await self.sync_children_shared(node_id, node.t_id)
+            elif node.stale:
+                tree_sync.enqueue(node_id)
 
-        role = await self.db.execute(select(UserRole).where(UserRole.user_id == user_id))
-        role = role.scalars().first()
-        response = []
-        if childs:
-            for child in childs:
-                if child.is_deleted:
+        if limit is None:
+            childs = await self._get_children(node_id)
+        else:
+            childs, next_after = await self._get_children_page(node_id, after or 0, limit)
+        # Следующий уровень скорее всего раскроют, прогреваем его в фоне
+        tree_prefetch.schedule([child["id"] for child in childs])
+        items = [{**child, "untouchable": untouchable} for child in childs]
+        if limit is None:
+            return items
+        return {"items": items, "next_after": next_after}
+
+    @staticmethod
+    def _children_stmt(node_id: int):
+        """Неудалённые дети узла по индексу ix_tree_parent_id_alive, только колонки списка: bio нужен лишь как флаг"""
+        return (
+            select(
+                Tree.id,
+                Tree.name,
+                Tree.birth,
+                Tree.death,
+                (func.coalesce(Tree.bio, '') != '').label('info'),
+                Tree.child_count,
+                Tree.descendant_count,
+                Tree.mini_icon,
+                Tree.main_icon,
+            )
+            .where(Tree.parent_id == node_id, Tree.is_deleted.isnot(True))
+            .order_by(Tree.id)
+        )
+
+    @staticmethod
+    def _children_item(row) -> dict:
+        return {
+            "id": row.id,
+            "name": row.name,
+            "birth": row.birth if row.birth else None,
+            "death": row.death if row.death else None,
+            "info": row.info,
+            "child_count": row.child_count,
+            "descendant_count": row.descendant_count,
+            "has_children": row.child_count > 0,
+            "mini_icon": row.mini_icon or None,  # Можно использовать `or`
+            "main_icon": row.main_icon or None,
+        }
+
+    async def _get_children(self, node_id: int) -> list[dict]:
+        """Неудалённые дети узла, через кэш children_cache"""
+        childs = children_cache.get(node_id)
+        if childs is not None:
+            return childs
+        # Промах кэша на популярном узле: одна выборка на все одновременные запросы
+        return await tree_flight.do(("children", node_id), lambda: self._load_children(node_id))
+
+    @classmethod
+    async def _load_children(cls, node_id: int) -> list[dict]:
+        version = children_cache.version(node_id)
+        async with async_session_factory() as db:
+            result = await db.execute(cls._children_stmt(node_id))
+            childs = [cls._children_item(row) for row in result.all()]
+        children_cache.set(node_id, childs, version)
+        return childs
+
+    async def _get_children_page(self, node_id: int, after: int, limit: int) -> tuple[list[dict], Optional[int]]:
+        """
+        Страница детей с id больше after. Если полный список уже в кэше, режем его,
+        иначе keyset-запрос по (parent_id, id) без загрузки всей семьи.
+        """
+        childs = children_cache.get(node_id)
+        if childs is not None:
+            start = bisect.bisect_right(childs, after, key=lambda child: child["id"])
+            page = childs[start:start + limit]
+            has_more = start + limit < len(childs)
+        else:
+            page = await tree_flight.do(
+                ("children", node_id, after, limit),
+                lambda: self._load_children_page(node_id, after, limit),
+            )
+            has_more = len(page) > limit
+            page = page[:limit]
+        return page, page[-1]["id"] if has_more else None
+
+    @classmethod
+    def _children_page_stmt(cls, node_id: int, after: int, limit: int):
+        # На одну строку больше, чтобы знать, есть ли следующая страница
+        return cls._children_stmt(node_id).where(Tree.id > after).limit(limit + 1)
+
+    @classmethod
+    async def _load_children_page(cls, node_id: int, after: int, limit: int) -> list[dict]:
+        async with async_session_factory() as db:
+            result = await db.execute(cls._children_page_stmt(node_id, after, limit))
+            return [cls._children_item(row) for row in result.all()]
+
+    def _subtree_stmt(self, node_id: int, depth: int, limit: int):
+        """Потомки узла на depth поколений вниз одним рекурсивным запросом, удалённые ветви отсекаются"""
+        subtree = (
+            select(
+                Tree.id,
+                Tree.parent_id,
+                Tree.name,
+                Tree.birth,
+                Tree.death,
+                (func.coalesce(Tree.bio, '') != '').label("info"),
+                Tree.mini_icon,
+                Tree.main_icon,
+                literal(0).label("level"),
+            )
+            .where(Tree.id == node_id)
+            .cte("subtree", recursive=True)
+        )
+        child = aliased(Tree)
+        subtree = subtree.union_all(
+            select(
+                child.id,
+                child.parent_id,
+                child.name,
+                child.birth,
+                child.death,
+                func.coalesce(child.bio, '') != '',
+                child.mini_icon,
+                child.main_icon,
+                subtree.c.level + 1,
+            )
+            .join(subtree, child.parent_id == subtree.c.id)
+            .where(subtree.c.level < depth, child.is_deleted.isnot(True))
+        )
+        # Без ORDER BY: рекурсия и так отдаёт строки по уровням, а LIMIT может остановить её раньше
+        return select(subtree).where(subtree.c.level > 0).limit(limit)
+
+    def _subtree_item(self, row) -> dict:
+        return {
+            "id": row.id,
+            "parent_id": row.parent_id,
+            "level": row.level,
+            "name": row.name,
+            "birth": row.birth if row.birth else None,
+            "death": row.death if row.death else None,
+            "info": row.info,
+            "mini_icon": row.mini_icon or None,
+            "main_icon": row.main_icon or None,
+        }
+
+    async def get_subtree(self, node_id: int, depth: int, limit: int, nested: bool = True):
+        result = await self.db.execute(select(Tree.id).where(Tree.id == node_id))
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail='Node not found')
+
+        if tree_snapshot.fresh() and tree_snapshot.exists(node_id):
+            # Структура из снимка, данные узлов одним запросом по id
+            found = tree_snapshot.descendants(node_id, depth, limit + 1)
+            truncated = len(found) > limit
+            found = found[:limit]
+            result = await self.db.execute(
+                select(
+                    Tree.id,
+                    Tree.name,
+                    Tree.birth,
+                    Tree.death,
+                    (func.coalesce(Tree.bio, '') != '').label("info"),
+                    Tree.mini_icon,
+                    Tree.main_icon,
+                ).where(Tree.id.in_([child_id for child_id, _, _ in found]))
+            )
+            rows = {row.id: row._asdict() for row in result.all()}
+            items = [
+                self._subtree_item(SimpleNamespace(**rows[child_id], parent_id=parent_id, level=level))
+                for child_id, parent_id, level in found
+                if child_id in rows
+            ]
+        else:
+            result = await self.db.execute(self._subtree_stmt(node_id, depth, limit + 1))
+            rows = result.all()
+            truncated = len(rows) > limit
+            items = [self._subtree_item(row) for row in rows[:limit]]
+
+        if nested:
+            # Родитель всегда идёт раньше потомков, поэтому дерево собирается за один проход
+            by_id = {node_id: {"children": []}}
+            for item in items:
+                parent = by_id.get(item["parent_id"])
+                if parent is None:
                     continue
+                item["children"] = []
+                parent["children"].append(item)
+                by_id[item["id"]] = item
+            items = by_id[node_id]["children"]
 
-                response.append({
-                    "id": child.id,
-                    "name": child.name,
-                    "birth": child.birth if child.birth else None,
-                    "death": child.death if child.death else None,
-                    "info": bool(child.bio),  # Более читабельная проверка
-                    "untouchable": True if role.role_id >= 2 else False,
-                    "mini_icon": child.mini_icon or None,  # Можно использовать `or`
-                    "main_icon": child.main_icon or None,
-                })
-        return response
+        return {
+            "id": node_id,
+            "depth": depth,
+            "truncated": truncated,
+            "nodes": items,
+        }
 
-    async def delete_tree_on_page(self, node_id: int):
+    async def stream_subtree(self, node_id: int, depth: int, limit: int):
+        """Плоский список потомков построчно через серверный курсор"""
+        result = await self.db.stream(
+            self._subtree_stmt(node_id, depth, limit).execution_options(yield_per=1000)
+        )
+        async for row in result:
+            yield self._subtree_item(row)
+
+    async def get_export_root(self, node_id: int) -> Tree:
+        result = await self.db.execute(select(Tree).where(Tree.id == node_id))
+        node = result.scalars().first()
+        if not node or node.is_deleted:
+            raise HTTPException(status_code=404, detail='Node not found')
+        return node
+
+    async def export_subtree(self, node_id: int, root_depth: int, fetch_size: int = 5000):
+        """
+        Все неудалённые потомки узла пачками по fetch_size строк через серверный курсор.
+        Потомки удалённых узлов тоже отсекаются: по каждому элементу пути проверяется
+        первичный ключ, есть ли среди предков удалённый узел ветви.
+        """
+        deleted = aliased(Tree)
+        stmt = (
+            select(
+                Tree.id,
+                Tree.parent_id,
+                (Tree.depth - root_depth).label("depth"),
+                Tree.name,
+                Tree.birth,
+                Tree.death,
+                Tree.t_id,
+            )
+            .where(
+                Tree.path.contains([node_id]),
+                Tree.is_deleted.isnot(True),
+                ~exists().where(
+                    deleted.id == any_(Tree.path),
+                    deleted.is_deleted.is_(True),
+                    deleted.path.contains([node_id]),
+                ),
+            )
+            .order_by(Tree.depth, Tree.id)
+            .execution_options(yield_per=fetch_size)
+        )
+        result = await self.db.stream(stmt)
+        async for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+    async def delete_tree_on_page(self, node_id: int, cascade: bool = False, dry_run: bool = False, max_nodes: int = None):
         result = await self.db.execute(select(Tree).where(Tree.id == node_id))
         node = result.scalars().first()
         if not node:
             raise HTTPException(status_code=404, detail='Node not found')
-        node.is_deleted = True
+        if cascade:
+            return await self._set_subtree_deleted(node, True, dry_run, max_nodes)
+        if dry_run:
+            # Без cascade меняется только сам узел
+            return {"affected": 0 if node.is_deleted else 1, "dry_run": True}
+
+        if not node.is_deleted:
+            node.is_deleted = True
+            await self._shift_counts({node.parent_id: (-1, -(1 + node.descendant_count))})
+            # У корня нет родителя: отмечаем сам узел, чтобы изменение дошло до снимка
+            self._touch_children(node.id)
         await self.db.commit()
+        self._publish_children()
         await self.db.refresh(node)
         return True
 
-    async def restore_tree_on_page(self, node_id: int):
+    async def restore_tree_on_page(self, node_id: int, cascade: bool = False, dry_run: bool = False, max_nodes: int = None):
         result = await self.db.execute(select(Tree).where(Tree.id == node_id))
         node = result.scalars().first()
         if not node:
             raise HTTPException(status_code=404, detail='Node not found')
-        node.is_deleted = False
+        if cascade:
+            return await self._set_subtree_deleted(node, False, dry_run, max_nodes)
+        if dry_run:
+            return {"affected": 1 if node.is_deleted else 0, "dry_run": True}
+
+        if node.is_deleted:
+            node.is_deleted = False
+            await self._shift_counts({node.parent_id: (1, 1 + node.descendant_count)})
+            # У корня нет родителя: отмечаем сам узел, чтобы изменение дошло до снимка
+            self._touch_children(node.id)
         await self.db.commit()
+        self._publish_children()
         await self.db.refresh(node)
         return True
 
-    async def search_data_by_name(self, name: str, parent_id: int):
-        stmt = select(Tree).where(Tree.name.ilike(f"%{name}%"))
-        result = await self.db.execute(stmt)
-        response = []
-        data = result.scalars().all()
-        for res in data:
-            if res.is_deleted:
-                continue
-            data = await self.get_parents(res.id, parent_id)
-            if data == False:
-                continue
+    async def _set_subtree_deleted(self, node: Tree, deleted: bool, dry_run: bool, max_nodes: int = None):
+        """
+        Удаление или восстановление узла вместе со всем поддеревом одним UPDATE по path.
+        dry_run только считает узлы, которые изменятся; больше max_nodes - 400.
+        """
+        max_nodes = max_nodes or settings.TREE_CASCADE_MAX_NODES
+        subtree = or_(Tree.id == node.id, Tree.path.contains([node.id]))
+        changing = Tree.is_deleted.isnot(True) if deleted else Tree.is_deleted.is_(True)
 
-            response.append({
-                "id": res.id,
-                "name": res.name,
-                "birth": res.birth if res.birth else None,
-                "death": res.death if res.death else None,
-                "parents": data
-            })  
-        return response
+        result = await self.db.execute(select(func.count()).where(subtree, changing))
+        affected = result.scalar_one()
+        if dry_run:
+            return {"affected": affected, "dry_run": True}
+        if affected > max_nodes:
+            raise HTTPException(
+                status_code=400,
+                detail=f'Subtree too large: {affected} nodes, limit {max_nodes}',
+            )
 
-    async def get_tree_data(self, node_id: int):
+        was_alive = not node.is_deleted
+        old_descendants = node.descendant_count
+        parent_id = node.parent_id
+
+        if deleted:
+            # Под удалённым корнем живых потомков не остаётся, счётчики поддерева обнуляются
+            result = await self.db.execute(
+                update(Tree)
+                .where(subtree)
+                .values(is_deleted=True, child_count=0, descendant_count=0)
+                .returning(Tree.id, Tree.path)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            if was_alive:
+                await self._shift_counts({parent_id: (-1, -(1 + old_descendants))})
+        else:
+            result = await self.db.execute(
+                update(Tree)
+                .where(subtree, changing)
+                .values(is_deleted=False)
+                .returning(Tree.id, Tree.path)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            await self._recount(node.id)
+
+            result = await self.db.execute(select(Tree.descendant_count).where(Tree.id == node.id))
+            new_descendants = result.scalar_one()
+            await self._shift_counts({
+                parent_id: (
+                    0 if was_alive else 1,
+                    1 + new_descendants - (1 + old_descendants if was_alive else 0),
+                ),
+            })
+
+        for row in rows:
+            self._touch_children(row.id)
+            self._touch_children(*row.path, stats=False)
+        await self.db.commit()
+        self._publish_children()
+        return {"affected": affected, "dry_run": False}
+
+    async def move_tree_on_page(self, node_id: int, new_parent_id: int):
         result = await self.db.execute(select(Tree).where(Tree.id == node_id))
         node = result.scalars().first()
-
         if not node:
             raise HTTPException(status_code=404, detail='Node not found')
 
-        result = await self.db.execute(select(User).where(User.id == node.created_by))
-        user = result.scalars().first()
-        if not user:
+        result = await self.db.execute(select(Tree).where(Tree.id == new_parent_id))
+        parent = result.scalars().first()
+        if not parent:
+            raise HTTPException(status_code=404, detail='Parent not found')
+        if parent.id == node.id or node.id in parent.path:
+            raise HTTPException(status_code=400, detail='Node cannot be moved under its own descendant')
+
+        # Переписываем префикс пути у всего поддерева одним UPDATE
+        old_depth = node.depth
+        new_path = [*parent.path, parent.id]
+        await self.db.execute(
+            update(Tree)
+            .where(Tree.path.contains([node.id]))
+            .values(
+                path=func.array_cat(
+                    literal(new_path, ARRAY(Integer)),
+                    Tree.path[old_depth + 1:func.cardinality(Tree.path)],
+                ),
+                depth=Tree.depth - old_depth + len(new_path),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if not node.is_deleted:
+            moved = 1 + node.descendant_count
+            await self._shift_counts({node.parent_id: (-1, -moved)})
+            await self._shift_counts({parent.id: (1, moved)})
+
+        self._touch_children(node.parent_id, parent.id)
+        node.parent_id = parent.id
+        node.path = new_path
+        node.depth = len(new_path)
+        await self.db.commit()
+        self._publish_children()
+        # Перенос меняет цепочки предков всего поддерева
+        pedigree_cache.clear()
+        return True
+
+    async def search_data_by_name(
+        self,
+        name: str,
+        parent_id: int,
+        limit: int = 50,
+        after: int = None,
+        fuzzy: bool = False,
+        min_similarity: float = 0.3,
+    ):
+        # Поддерево и удалённые записи отсекаются в SQL. Оба режима идут через GIN-индекс
+        # ix_tree_name_trgm: ILIKE выдаёт страницы по курсору id, нечеткий режим
+        # ранжирует по similarity и прощает опечатки.
+        score = func.similarity(Tree.name, name).label("score")
+        stmt = (
+            select(Tree.id, Tree.name, Tree.birth, Tree.death, Tree.path, score)
+            .where(Tree.is_deleted.isnot(True), Tree.depth > 0)
+            .limit(limit)
+        )
+        if parent_id:
+            stmt = stmt.where(Tree.path.contains([parent_id]))
+
+        if fuzzy:
+            # Порог оператора % действует только до конца текущей транзакции
+            await self.db.execute(select(func.set_config("pg_trgm.similarity_threshold", str(min_similarity), True)))
+            stmt = stmt.where(Tree.name.op("%")(name)).order_by(score.desc(), Tree.id)
+        else:
+            stmt = stmt.where(Tree.name.ilike(f"%{name}%")).order_by(Tree.id)
+            if after:
+                stmt = stmt.where(Tree.id > after)
+
+        result = await self.db.execute(stmt)
+        hits = result.all()
+        if not hits:
+            return []
+
+        # Имена предков для всей страницы одним запросом
+        ancestor_ids = {ancestor_id for hit in hits for ancestor_id in hit.path}
+        result = await self.db.execute(select(Tree.id, Tree.name).where(Tree.id.in_(ancestor_ids)))
+        names = dict(result.all())
+
+        response = []
+        for hit in hits:
+            response.append({
+                "id": hit.id,
+                "name": hit.name,
+                "birth": hit.birth if hit.birth else None,
+                "death": hit.death if hit.death else None,
+                "score": round(hit.score, 3),
+                "parents": [
+                    {"id": ancestor_id, "name": names[ancestor_id]}
+                    for ancestor_id in hit.path
+                    if ancestor_id in names
+                ]
+            })
+        return response
+
+    async def suggest_names(self, query: str, limit: int = 10):
+        if suggest_index.ready:
+            return suggest_index.suggest(query, limit)
+
+        # Пока индекс строится после старта, отвечаем из БД по префиксу
+        result = await self.db.execute(
+            select(Tree.name, func.array_agg(Tree.id))
+            .where(Tree.name.ilike(f"{query}%"), Tree.is_deleted.isnot(True))
+            .group_by(Tree.name)
+            .order_by(Tree.name)
+            .limit(limit)
+        )
+        return [{"name": name, "ids": ids} for name, ids in result.all()]
+
+    def _details_stmt(self):
+        """Узел и автор одним запросом, автора может не быть"""
+        return (
+            select(
+                Tree.id,
+                Tree.name,
+                Tree.mini_icon,
+                Tree.main_icon,
+                Tree.birth,
+                Tree.death,
+                Tree.bio,
+                User.id.label("user_id"),
+                User.first_name,
+                User.last_name,
+            )
+            .outerjoin(User, User.id == Tree.created_by)
+        )
+
+    def _details_item(self, row) -> dict:
+        if row.user_id is None:
             userD = None
         else:
             userD = {
-                "id": user.id,
-                "full_name": f'{user.first_name} {user.last_name}',
+                "id": row.user_id,
+                "full_name": f'{row.first_name} {row.last_name}',
             }
 
         return {
-            "id": node.id,
-            "name": node.name,
-            "mini_icon": node.mini_icon,
-            "main_icon": node.main_icon,
-            "birth": node.birth,
-            "death": node.death,
-            "bio": node.bio,
+            "id": row.id,
+            "name": row.name,
+            "mini_icon": row.mini_icon,
+            "main_icon": row.main_icon,
+            "birth": row.birth,
+            "death": row.death,
+            "bio": row.bio,
             "created_by": userD
         }
 
-    async def get_parents(self, tree_id: int, parent_id: int = None):
-        parents = []
-        current_id = tree_id
+    async def get_tree_data(self, node_id: int):
+        result = await self.db.execute(self._details_stmt().where(Tree.id == node_id))
+        row = result.first()
 
-        while current_id is not None:
-            stmt = select(Tree).where(Tree.id == current_id)
-            result = await self.db.execute(stmt)
-            node = result.scalar_one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail='Node not found')
+        return self._details_item(row)
 
-            if not node or node.parent_id is None:
-                break
+    async def get_tree_data_batch(self, node_ids: list[int]):
+        """Карточки нескольких узлов в порядке запроса, ненайденные id перечисляются в missing"""
+        node_ids = list(dict.fromkeys(node_ids))
+        result = await self.db.execute(self._details_stmt().where(Tree.id.in_(node_ids)))
+        items = {row.id: self._details_item(row) for row in result.all()}
 
-            stmt = select(Tree).where(Tree.id == node.parent_id)
-            result = await self.db.execute(stmt)
-            parent = result.scalar_one_or_none()
-
-            if parent:
-                parents.append({
-                    "id": parent.id,
-                    "name": parent.name,
-                })
-                current_id = parent.id
-            else:
-                break
+        return {
+            "items": [items[node_id] for node_id in node_ids if node_id in items],
+            "missing": [node_id for node_id in node_ids if node_id not in items],
+        }
+
+    async def _shift_counts(self, changes: dict[int, tuple[int, int]]):
+        """
+        Поправляет денормализованные счётчики.
+
+        changes: id родителя -> (изменение child_count, изменение числа потомков).
+        descendant_count растёт у родителя и вверх по пути до первого удалённого
+        предка включительно: выше удалённого узла его ветвь уже не считается.
+        """
+        changes = {parent_id: delta for parent_id, delta in changes.items() if parent_id is not None}
+        if not changes:
+            return
+
+        result = await self.db.execute(
+            select(Tree.id, Tree.path, Tree.is_deleted).where(Tree.id.in_(changes.keys()))
+        )
+        # Отсутствующие в tree родители просто не попадут в выборку
+        parents = result.all()
+
+        ancestor_ids = {ancestor_id for parent in parents for ancestor_id in parent.path}
+        deleted = {parent.id for parent in parents if parent.is_deleted}
+        if ancestor_ids:
+            result = await self.db.execute(
+                select(Tree.id).where(Tree.id.in_(ancestor_ids), Tree.is_deleted.is_(True))
+            )
+            deleted.update(result.scalars().all())
+
+        children_delta = defaultdict(int)
+        descendants_delta = defaultdict(int)
+        for parent in parents:
+            # Счётчики узлов пути видны в списках детей их родителей
+            self._touch_children(parent.id)
+            self._touch_children(*parent.path, stats=False)
+            children, descendants = changes[parent.id]
+            children_delta[parent.id] += children
+            for ancestor_id in [parent.id, *reversed(parent.path)]:
+                descendants_delta[ancestor_id] += descendants
+                if ancestor_id in deleted:
+                    break
+        # Родителя нет в tree (узлы-сироты): поправлять нечего
+        if not descendants_delta:
+            return
+
+        table = Tree.__table__
+        await self.db.execute(
+            update(table)
+            .where(table.c.id == bindparam("node_id"))
+            .values(
+                child_count=table.c.child_count + bindparam("children"),
+                descendant_count=table.c.descendant_count + bindparam("descendants"),
+                updated_at=table.c.updated_at,
+            ),
+            [
+                {
+                    "node_id": node_id,
+                    "children": children_delta.get(node_id, 0),
+                    "descendants": descendants,
+                }
+                for node_id, descendants in descendants_delta.items()
+            ],
+        )
+
+    async def recount_tree(self, root_id: int = None):
+        """
+        Полный пересчёт child_count и descendant_count снизу вверх, по одному UPDATE на поколение.
+        С root_id пересчитывается только поддерево узла, без изменения его предков.
+        """
+        levels = await self._recount(root_id)
+        await self.db.commit()
+        return levels
+
+    async def _recount(self, root_id: int = None):
+        scope = []
+        if root_id is not None:
+            scope = [or_(Tree.id == root_id, Tree.path.contains([root_id]))]
+
+        result = await self.db.execute(select(func.max(Tree.depth)).where(*scope))
+        max_depth = result.scalar_one_or_none()
+        if max_depth is None:
+            return 0
+
+        child = aliased(Tree)
+        for level in range(max_depth, -1, -1):
+            counts = (
+                select(
+                    Tree.id.label("id"),
+                    func.count(child.id).label("children"),
+                    func.coalesce(func.sum(1 + child.descendant_count), 0).label("descendants"),
+                )
+                .outerjoin(child, and_(child.parent_id == Tree.id, child.is_deleted.isnot(True)))
+                .where(Tree.depth == level, *scope)
+                .group_by(Tree.id)
+                .subquery()
+            )
+            await self.db.execute(
+                update(Tree)
+                .where(Tree.id == counts.c.id)
+                .values(
+                    child_count=counts.c.children,
+                    descendant_count=counts.c.descendants,
+                    updated_at=Tree.updated_at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        return max_depth + 1
+
+    async def _child_path(self, parent_id: int) -> list[int]:
+        """Материализованный путь для нового потомка узла parent_id"""
+        result = await self.db.execute(select(Tree.path).where(Tree.id == parent_id))
+        parent_path = result.scalar_one_or_none()
+        if parent_path is None:
+            return []
+        return [*parent_path, parent_id]
+
+    async def get_parents(self, tree_id: int, parent_id: int = None, max_depth: int = None):
+        ancestors = tree_snapshot.ancestors(tree_id) if tree_snapshot.fresh() else None
+        if ancestors is not None:
+            # Цепочка из снимка в памяти, из БД только имена
+            if max_depth:
+                ancestors = ancestors[-max_depth:]
+            result = await self.db.execute(select(Tree.id, Tree.name).where(Tree.id.in_(ancestors)))
+            names = dict(result.all())
+            parents = [{"id": ancestor_id, "name": names[ancestor_id]} for ancestor_id in ancestors if ancestor_id in names]
+        else:
+            parents = await self._get_parents_from_db(tree_id, max_depth)
 
         if not parents:
             return False
@@ -191,4 +880,149 @@ class TreeService:
         if parent_id and not any(p["id"] == parent_id for p in parents):
             return False
 
-        return parents[::-1]
+        return parents
+
+    async def _get_parents_from_db(self, tree_id: int, max_depth: int = None):
+        # Предки берутся из материализованного пути узла одним запросом
+        node = aliased(Tree)
+        stmt = (
+            select(Tree.id, Tree.name)
+            .join(node, Tree.id == any_(node.path))
+            .where(node.id == tree_id)
+            .order_by(Tree.depth.desc())
+        )
+        if max_depth:
+            stmt = stmt.limit(max_depth)
+
+        result = await self.db.execute(stmt)
+        return [{"id": row.id, "name": row.name} for row in result.all()][::-1]
+
+    async def get_relation(self, a: int, b: int):
+        """
+        Родство двух узлов: ближайший общий предок и число поколений от него до каждого узла.
+        Цепочки берутся из снимка в памяти, иначе из материализованных путей в БД.
+        """
+        if tree_snapshot.fresh() and tree_snapshot.exists(a) and tree_snapshot.exists(b):
+            if tree_snapshot.is_deleted(a) or tree_snapshot.is_deleted(b):
+                raise HTTPException(status_code=404, detail='Node not found')
+            lca = tree_snapshot.lca(a, b)
+            ids = [a, b] if lca is None else [a, b, lca[0]]
+            result = await self.db.execute(select(Tree.id, Tree.name).where(Tree.id.in_(ids)))
+            names = dict(result.all())
+            return {
+                "a": {"id": a, "name": names.get(a)},
+                "b": {"id": b, "name": names.get(b)},
+                "related": lca is not None,
+                "ancestor": {"id": lca[0], "name": names.get(lca[0])} if lca else None,
+                "generations_a": lca[1] if lca else None,
+                "generations_b": lca[2] if lca else None,
+            }
+
+        result = await self.db.execute(
+            select(Tree.id, Tree.name, Tree.path, Tree.depth)
+            .where(Tree.id.in_([a, b]), Tree.is_deleted.isnot(True))
+        )
+        nodes = {row.id: row for row in result.all()}
+        if a not in nodes or b not in nodes:
+            raise HTTPException(status_code=404, detail='Node not found')
+
+        # Цепочки от корня до самого узла включительно
+        chain_a = [*nodes[a].path, a]
+        chain_b = [*nodes[b].path, b]
+        common = 0
+        while common < min(len(chain_a), len(chain_b)) and chain_a[common] == chain_b[common]:
+            common += 1
+
+        response = {
+            "a": {"id": a, "name": nodes[a].name},
+            "b": {"id": b, "name": nodes[b].name},
+            "related": common > 0,
+            "ancestor": None,
+            "generations_a": None,
+            "generations_b": None,
+        }
+        if not common:
+            return response
+
+        ancestor_id = chain_a[common - 1]
+        if ancestor_id in nodes:
+            ancestor_name = nodes[ancestor_id].name
+        else:
+            result = await self.db.execute(select(Tree.name).where(Tree.id == ancestor_id))
+            ancestor_name = result.scalar_one_or_none()
+
+        response.update({
+            "ancestor": {"id": ancestor_id, "name": ancestor_name},
+            "generations_a": len(chain_a) - common,
+            "generations_b": len(chain_b) - common,
+        })
+        return response
+
+    async def get_pedigree(self, node_id: int, generations: int = 7):
+        """
+        Жеті ата: узел и его предки на generations поколений вверх,
+        на каждом уровне - братья и сёстры. Все уровни одним запросом
+        по parent_id, путь узла берётся из снимка или из БД.
+        """
+        key = (node_id, generations)
+        fresh = tree_snapshot.fresh()
+        cached = pedigree_cache.get(key)
+        # Запись сверяется с путём по свежему снимку: перенос ветви в другом процессе
+        # этот кэш не сбрасывает
+        if cached is not None and (not fresh or cached[0] == tree_snapshot.ancestors(node_id)):
+            return cached[1]
+        version = pedigree_cache.version(key)
+
+        # Снимок не свежий и сразу после записи в этом процессе: тогда путь берётся из БД
+        path = tree_snapshot.ancestors(node_id) if fresh else None
+        if path is None:
+            result = await self.db.execute(select(Tree.path).where(Tree.id == node_id))
+            path = result.scalar_one_or_none()
+            if path is None:
+                raise HTTPException(status_code=404, detail='Node not found')
+
+        # Цепочка от узла вверх; у каждого её члена братья - дети его родителя
+        chain = [node_id, *reversed(path)][:generations + 1]
+        parents = path[-(generations + 1):]
+        result = await self.db.execute(
+            select(Tree.id, Tree.name, Tree.birth, Tree.death, Tree.parent_id)
+            .where(
+                or_(Tree.parent_id.in_(parents), Tree.id.in_(chain)),
+                Tree.is_deleted.isnot(True),
+            )
+            .order_by(Tree.id)
+        )
+        people = {}
+        children = defaultdict(list)
+        for row in result.all():
+            person = {
+                "id": row.id,
+                "name": row.name,
+                "birth": row.birth if row.birth else None,
+                "death": row.death if row.death else None,
+            }
+            people[row.id] = person
+            children[row.parent_id].append(person)
+
+        if node_id not in people:
+            raise HTTPException(status_code=404, detail='Node not found')
+
+        levels = []
+        for generation, member_id in enumerate(chain):
+            person = people.get(member_id)
+            if person is None:
+                # Удалённый предок обрывает цепочку
+                break
+            parent_id = path[len(path) - generation - 1] if generation < len(path) else None
+            levels.append({
+                "generation": generation,
+                "person": person,
+                "siblings": [
+                    sibling for sibling in children.get(parent_id, [])
+                    if sibling["id"] != member_id
+                ] if parent_id is not None else [],
+            })
+
+        response = {"id": node_id, "generations": generations, "levels": levels}
+        pedigree_cache.set(key, (list(path), response), version, depends_on=[*parents, *chain])
+        return response
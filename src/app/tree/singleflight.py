@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вычислений.
+
+    Первый запрос по ключу запускает вычисление отдельной задачей, остальные
+    ждут её же результат или исключение. Отмена ожидающего запроса задачу
+    не прерывает, поэтому вычисление должно работать в своей сессии БД.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        self.calls += 1
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Исключение забираем, даже если все ожидающие уже отменены
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+
+tree_flight = SingleFlight()
@@ -0,0 +1,376 @@
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, func
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory
+from src.app.tree.models import Tree
+from src.app.tree.suggest import REFRESH_OVERLAP
+
+# Заголовок файла: magic, версия формата, размер массивов (max id + 1), число рёбер, водяной знак updated_at
+HEADER = struct.Struct('<8sIiid')
+MAGIC = b'ATTKTREE'
+VERSION = 1
+
+NO_PARENT = -1
+ALIVE, DELETED, ABSENT = 0, 1, 2
+
+# Защита от циклов в parent_id при подъёме к корню
+MAX_DEPTH = 1024
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def build_arrays(parent: array, flags: array):
+    """
+    Достраивает снимок по заполненным parent и flags (индекс - id узла).
+
+    Дети узла i лежат в children[offsets[i]:offsets[i + 1]] по возрастанию id (CSR).
+    depth считается обходом в ширину от корней, для узлов в циклах остаётся -1.
+    """
+    size = len(parent)
+    offsets = array('i', [0]) * (size + 1)
+    for node_id in range(size):
+        parent_id = parent[node_id]
+        if flags[node_id] != ABSENT and 0 <= parent_id < size:
+            offsets[parent_id + 1] += 1
+    for node_id in range(size):
+        offsets[node_id + 1] += offsets[node_id]
+
+    children = array('i', [0]) * offsets[size]
+    position = array('i', offsets)
+    for node_id in range(size):
+        parent_id = parent[node_id]
+        if flags[node_id] != ABSENT and 0 <= parent_id < size:
+            children[position[parent_id]] = node_id
+            position[parent_id] += 1
+
+    depth = array('i', [-1]) * size
+    queue = deque()
+    for node_id in range(size):
+        if flags[node_id] == ABSENT:
+            continue
+        parent_id = parent[node_id]
+        if parent_id == NO_PARENT or parent_id >= size or flags[parent_id] == ABSENT:
+            depth[node_id] = 0
+            queue.append(node_id)
+    while queue:
+        node_id = queue.popleft()
+        for child_id in children[offsets[node_id]:offsets[node_id + 1]]:
+            if depth[child_id] == -1:
+                depth[child_id] = depth[node_id] + 1
+                queue.append(child_id)
+
+    return parent, flags, depth, offsets, children
+
+
+def write_snapshot(path: str, arrays, watermark: float):
+    """Атомарная запись снимка: временный файл и os.replace, уже отображённые копии не ломаются"""
+    parent, flags, depth, offsets, children = arrays
+    size = len(parent)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, len(children), watermark))
+        for data in (parent, depth, offsets, children, flags):
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            data.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class MappedSnapshot:
+    """Массивы снимка поверх mmap без копирования: страницы файла общие для всех процессов"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (stat.st_ino, stat.st_mtime_ns)
+        self.created_at = stat.st_mtime
+
+        magic, version, size, edges, self.watermark = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path}: неизвестный формат снимка")
+        self.size = size
+
+        self._view = memoryview(self._mmap)
+        offset = HEADER.size
+        arrays = []
+        for typecode, length in (('i', size), ('i', size), ('i', size + 1), ('i', edges), ('B', size)):
+            offset = _align(offset)
+            itemsize = array(typecode).itemsize
+            arrays.append(self._view[offset:offset + length * itemsize].cast(typecode))
+            offset += length * itemsize
+        self.parent, self.depth, self.offsets, self.children, self.flags = arrays
+
+    def close(self):
+        for data in (self.parent, self.depth, self.offsets, self.children, self.flags, self._view):
+            data.release()
+        self._mmap.close()
+
+
+class TreeSnapshot:
+    """
+    Снимок структуры дерева в памяти: parent, флаги удаления, CSR детей и глубина.
+
+    Файл снимка строит один процесс (flock), остальные отображают его через mmap.
+    Между перестроениями изменения из БД догружаются по updated_at в небольшой
+    оверлей поверх файла. Если обновление давно не проходило, fresh() возвращает
+    False и TreeService идёт в БД. После записи в этом процессе (touch) снимок
+    тоже не используется, пока не пройдёт обновление, начатое после неё:
+    обновление запускается сразу, не дожидаясь очередного тика.
+    """
+
+    def __init__(self, path: str, refresh_seconds: float, max_lag: float, rebuild_seconds: float, max_overlay: int):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.max_lag = max_lag
+        self.rebuild_seconds = rebuild_seconds
+        self.max_overlay = max_overlay
+
+        self._data: Optional[MappedSnapshot] = None
+        # id -> (parent_id, флаг) для узлов, изменившихся после построения файла
+        self._overlay: dict[int, tuple[int, int]] = {}
+        # parent_id -> узлы, которые по оверлею могли стать его детьми
+        self._overlay_children: dict[int, set[int]] = {}
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        # Начало последнего завершённого обновления и время последней записи процесса
+        self._synced_at = 0.0
+        self._written_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def fresh(self) -> bool:
+        return (
+            self._data is not None
+            and self._synced_at > self._written_at
+            and time.monotonic() - self._refreshed_at <= self.max_lag
+        )
+
+    def touch(self):
+        """Вызывается после коммита изменений дерева в этом процессе"""
+        self._written_at = time.monotonic()
+        self._wakeup.set()
+
+    # Чтение
+
+    def _base(self, node_id: int) -> tuple[int, int]:
+        data = self._data
+        if 0 <= node_id < data.size:
+            return data.parent[node_id], data.flags[node_id]
+        return NO_PARENT, ABSENT
+
+    def _node(self, node_id: int) -> tuple[int, int]:
+        overlay = self._overlay.get(node_id)
+        return overlay if overlay is not None else self._base(node_id)
+
+    def exists(self, node_id: int) -> bool:
+        return self._node(node_id)[1] != ABSENT
+
+    def is_deleted(self, node_id: int) -> bool:
+        return self._node(node_id)[1] == DELETED
+
+    def ancestors(self, node_id: int) -> Optional[list[int]]:
+        """id предков от корня до родителя, None если узла нет в снимке"""
+        parent_id, flag = self._node(node_id)
+        if flag == ABSENT:
+            return None
+
+        chain = []
+        while parent_id != NO_PARENT and len(chain) < MAX_DEPTH:
+            next_parent, flag = self._node(parent_id)
+            if flag == ABSENT:
+                break
+            chain.append(parent_id)
+            parent_id = next_parent
+        return chain[::-1]
+
+    def depth(self, node_id: int) -> Optional[int]:
+        if not self._overlay and self.exists(node_id):
+            depth = self._data.depth[node_id]
+            if depth >= 0:
+                return depth
+        ancestors = self.ancestors(node_id)
+        return len(ancestors) if ancestors is not None else None
+
+    def children(self, node_id: int) -> list[int]:
+        """Все дети узла, включая удалённые, по возрастанию id"""
+        data = self._data
+        base = []
+        if 0 <= node_id < data.size:
+            base = data.children[data.offsets[node_id]:data.offsets[node_id + 1]].tolist()
+        if not self._overlay:
+            return base
+
+        result = [child_id for child_id in base if self._node(child_id)[0] == node_id]
+        moved_in = [
+            child_id for child_id in self._overlay_children.get(node_id, ())
+            if self._node(child_id)[0] == node_id and self._base(child_id)[0] != node_id
+        ]
+        if moved_in:
+            result = sorted(result + moved_in)
+        return result
+
+    def descendants(self, node_id: int, max_depth: int, limit: int) -> list[tuple[int, int, int]]:
+        """(id, parent_id, level) неудалённых потомков обходом в ширину, удалённые ветви отсекаются"""
+        result = []
+        queue = deque([(node_id, 0)])
+        while queue and len(result) < limit:
+            current, level = queue.popleft()
+            if level >= max_depth:
+                continue
+            for child_id in self.children(current):
+                if self.is_deleted(child_id):
+                    continue
+                result.append((child_id, current, level + 1))
+                if len(result) >= limit:
+                    break
+                queue.append((child_id, level + 1))
+        return result
+
+    def lca(self, a: int, b: int) -> Optional[tuple[int, int, int]]:
+        """(общий предок, поколений от него до a, до b); None если узла нет или корни разные"""
+        chain_a, chain_b = self.ancestors(a), self.ancestors(b)
+        if chain_a is None or chain_b is None:
+            return None
+        chain_a.append(a)
+        chain_b.append(b)
+
+        common = 0
+        while common < min(len(chain_a), len(chain_b)) and chain_a[common] == chain_b[common]:
+            common += 1
+        if not common:
+            return None
+        return chain_a[common - 1], len(chain_a) - common, len(chain_b) - common
+
+    # Обновление
+
+    def _apply(self, rows):
+        for node_id, parent_id, is_deleted, updated_at in rows:
+            node = (parent_id if parent_id is not None else NO_PARENT, DELETED if is_deleted else ALIVE)
+            previous = self._overlay.pop(node_id, None)
+            if previous is not None:
+                self._overlay_children.get(previous[0], set()).discard(node_id)
+            if node != self._base(node_id):
+                self._overlay[node_id] = node
+                self._overlay_children.setdefault(node[0], set()).add(node_id)
+            if updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def _map(self) -> bool:
+        """Отображает файл снимка, если он новее текущего"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if self._data is not None and self._data.inode == (stat.st_ino, stat.st_mtime_ns):
+            return False
+
+        data = MappedSnapshot(self.path)
+        if self._data is not None:
+            self._data.close()
+        self._data = data
+        self._overlay, self._overlay_children = {}, {}
+        self._watermark = datetime.fromtimestamp(data.watermark) if data.watermark else None
+        logging.info(f"Снимок дерева загружен: {data.size} id, {len(data.children)} связей")
+        return True
+
+    async def build(self) -> bool:
+        """Строит файл снимка из БД. False, если его уже строит другой процесс."""
+        with open(f"{self.path}.lock", 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            async with async_session_factory() as db:
+                result = await db.execute(select(func.max(Tree.id), func.max(Tree.updated_at)))
+                max_id, watermark = result.one()
+
+                size = (max_id or 0) + 1
+                parent = array('i', [NO_PARENT]) * size
+                flags = array('B', [ABSENT]) * size
+                stream = await db.stream(
+                    select(Tree.id, Tree.parent_id, Tree.is_deleted)
+                    .where(Tree.id < size)
+                    .execution_options(yield_per=10000)
+                )
+                async for partition in stream.partitions():
+                    for node_id, parent_id, is_deleted in partition:
+                        parent[node_id] = parent_id if parent_id is not None else NO_PARENT
+                        flags[node_id] = DELETED if is_deleted else ALIVE
+
+            # Строки, добавленные после max(id), придут следующим обновлением через оверлей.
+            # Построение CSR и запись занимают процессор, выносим их из цикла событий
+            arrays = await asyncio.to_thread(build_arrays, parent, flags)
+            await asyncio.to_thread(write_snapshot, self.path, arrays, watermark.timestamp() if watermark else 0.0)
+        return True
+
+    async def refresh(self):
+        """Догружает изменения по updated_at в оверлей"""
+        stmt = select(Tree.id, Tree.parent_id, Tree.is_deleted, Tree.updated_at)
+        if self._watermark:
+            stmt = stmt.where(Tree.updated_at >= self._watermark - REFRESH_OVERLAP)
+
+        # Запрос видит всё, что закоммичено до его начала
+        started = time.monotonic()
+        async with async_session_factory() as db:
+            result = await db.execute(stmt)
+            self._apply(result.all())
+        self._refreshed_at = time.monotonic()
+        self._synced_at = started
+
+    async def _tick(self):
+        self._map()
+        expired = self._data is None or time.time() - self._data.created_at >= self.rebuild_seconds
+        if expired or len(self._overlay) > self.max_overlay:
+            if await self.build():
+                self._map()
+        if self._data is not None:
+            await self.refresh()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении снимка дерева: {e}")
+            # Следующий тик по таймеру или сразу после записи в этом процессе
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.refresh_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+tree_snapshot = TreeSnapshot(
+    path=settings.TREE_SNAPSHOT_PATH,
+    refresh_seconds=settings.TREE_SNAPSHOT_REFRESH_SECONDS,
+    max_lag=settings.TREE_SNAPSHOT_MAX_LAG_SECONDS,
+    rebuild_seconds=settings.TREE_SNAPSHOT_REBUILD_SECONDS,
+    max_overlay=settings.TREE_SNAPSHOT_MAX_OVERLAY,
+)
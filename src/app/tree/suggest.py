@@ -0,0 +1,176 @@
+import asyncio
+import bisect
+import logging
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory
+from src.app.tree.models import Tree
+
+# Казахская кириллица и латиница сводятся к одному латинскому ключу,
+# чтобы «Әли», «Äli» и «Ali» находились одинаково
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'ә': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': 'g', 'д': 'd',
+    'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'i', 'і': 'i',
+    'к': 'k', 'қ': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'ң': 'n', 'о': 'o',
+    'ө': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ұ': 'u',
+    'ү': 'u', 'ф': 'f', 'х': 'h', 'һ': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh',
+    'щ': 'sh', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'iu', 'я': 'ia',
+    'ı': 'i', 'ğ': 'g', 'ñ': 'n', 'ş': 'sh', 'ç': 'ch', 'q': 'k', 'x': 'h',
+})
+
+# Перекрытие окна обновления: строки из долгих транзакций получают updated_at раньше коммита
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+def normalize_name(name: str) -> str:
+    """Ключ поиска: нижний регистр, транслитерация в латиницу без диакритики"""
+    value = unicodedata.normalize('NFC', name.casefold()).translate(_TRANSLIT)
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.split())
+
+
+class NameIndex:
+    """
+    Префиксный индекс имён шежіре в памяти процесса.
+
+    Ключи хранятся в отсортированном списке, поиск по префиксу - bisect.
+    Память ограничена числом ключей и числом id на ключ.
+    """
+
+    def __init__(self, max_keys: int, max_ids_per_key: int):
+        self.max_keys = max_keys
+        self.max_ids_per_key = max_ids_per_key
+
+        self._keys: list[str] = []
+        self._labels: dict[str, str] = {}
+        self._ids: dict[str, list[int]] = {}
+        self._node_keys: dict[int, str] = {}
+
+        self.ready = False
+        self.last_updated_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._node_keys)
+
+    def _add(self, node_id: int, name: str, insort: bool = True, key: Optional[str] = None):
+        key = key if key is not None else normalize_name(name)
+        if not key:
+            return
+
+        ids = self._ids.get(key)
+        if ids is None:
+            if len(self._ids) >= self.max_keys:
+                return
+            ids = self._ids[key] = []
+            self._labels[key] = name
+            if insort:
+                bisect.insort(self._keys, key)
+            else:
+                self._keys.append(key)
+
+        if len(ids) < self.max_ids_per_key:
+            ids.append(node_id)
+            self._node_keys[node_id] = key
+
+    def _remove(self, node_id: int):
+        key = self._node_keys.pop(node_id, None)
+        if key is None:
+            return
+
+        ids = self._ids[key]
+        ids.remove(node_id)
+        if not ids:
+            del self._ids[key]
+            del self._labels[key]
+            self._keys.pop(bisect.bisect_left(self._keys, key))
+
+    def apply(self, rows, insort: bool = True):
+        """Применяет строки (id, name, is_deleted, updated_at) к индексу"""
+        for node_id, name, is_deleted, updated_at in rows:
+            key = normalize_name(name) if name and not is_deleted else None
+            # Окно перекрытия каждый раз возвращает одни и те же строки: если ключ
+            # не изменился, не трогаем отсортированный список (pop/insort - O(n))
+            if key != self._node_keys.get(node_id):
+                self._remove(node_id)
+                if key:
+                    self._add(node_id, name, insort, key)
+            if updated_at and (self.last_updated_at is None or updated_at > self.last_updated_at):
+                self.last_updated_at = updated_at
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict]:
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+
+        response = []
+        position = bisect.bisect_left(self._keys, prefix)
+        while position < len(self._keys) and len(response) < limit:
+            key = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            response.append({"name": self._labels[key], "ids": list(self._ids[key])})
+            position += 1
+        return response
+
+    async def build(self):
+        """Полная загрузка индекса из БД"""
+        self._keys, self._labels, self._ids, self._node_keys = [], {}, {}, {}
+        self.last_updated_at = None
+
+        async with async_session_factory() as db:
+            result = await db.stream(
+                select(Tree.id, Tree.name, Tree.is_deleted, Tree.updated_at)
+                .execution_options(yield_per=10000)
+            )
+            async for rows in result.partitions():
+                self.apply(rows, insort=False)
+
+        self._keys.sort()
+        self.ready = True
+        logging.info(f"Индекс подсказок построен: {len(self._keys)} ключей, {len(self)} узлов")
+
+    async def refresh(self):
+        """Догружает изменения по updated_at"""
+        stmt = select(Tree.id, Tree.name, Tree.is_deleted, Tree.updated_at).order_by(Tree.updated_at)
+        if self.last_updated_at:
+            stmt = stmt.where(Tree.updated_at >= self.last_updated_at - REFRESH_OVERLAP)
+
+        async with async_session_factory() as db:
+            result = await db.execute(stmt)
+            self.apply(result.all())
+
+    async def _run(self):
+        while not self.ready:
+            try:
+                await self.build()
+            except Exception as e:
+                logging.error(f"Ошибка при построении индекса подсказок: {e}")
+                await asyncio.sleep(settings.TREE_SUGGEST_REFRESH_SECONDS)
+
+        while True:
+            await asyncio.sleep(settings.TREE_SUGGEST_REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении индекса подсказок: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+suggest_index = NameIndex(
+    max_keys=settings.TREE_SUGGEST_MAX_KEYS,
+    max_ids_per_key=settings.TREE_SUGGEST_MAX_IDS_PER_KEY,
+)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+from src.app.config.base import settings
+from src.app.db.core import async_session_factory
+from src.app.tree.models import Tree
+
+
+class TreeSyncWorker:
+    """
+    Фоновая синхронизация детей узлов с tumalas.kz.
+
+    Запросы к дереву только ставят устаревший узел в очередь, сами
+    обновления выполняют несколько воркеров со своими сессиями БД.
+    Узел, уже стоящий в очереди, повторно не добавляется.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pending: set[int] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    def enqueue(self, node_id: int) -> bool:
+        if node_id in self._pending:
+            return False
+        try:
+            self._queue.put_nowait(node_id)
+        except asyncio.QueueFull:
+            logging.warning(f"Очередь синхронизации переполнена, узел {node_id} пропущен")
+            return False
+        self._pending.add(node_id)
+        return True
+
+    async def _sync(self, node_id: int):
+        # Импорт здесь: сервис сам ставит узлы в эту очередь
+        from src.app.tree.service import TreeService
+
+        async with async_session_factory() as db:
+            node = await db.get(Tree, node_id)
+            if node is None or not node.t_id:
+                return
+            t_id = node.t_id
+        await TreeService.sync_children_shared(node_id, t_id)
+
+    async def _worker(self):
+        while True:
+            node_id = await self._queue.get()
+            try:
+                await self._sync(node_id)
+            except Exception as e:
+                logging.error(f"Ошибка фоновой синхронизации узла {node_id}: {e}")
+            finally:
+                self._pending.discard(node_id)
+                self._queue.task_done()
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+tree_sync = TreeSyncWorker(
+    workers=settings.TUMALAS_SYNC_WORKERS,
+    queue_size=settings.TUMALAS_SYNC_QUEUE_SIZE,
+)
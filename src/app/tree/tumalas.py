@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from src.app.config.base import settings
+
+
+def tumalas_hash(name, birth, death) -> str:
+    """md5 содержимого узла tumalas: имя и годы жизни, разделённые chr(31)"""
+    value = '\x1f'.join('' if part is None else str(part) for part in (name, birth, death))
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+class CircuitOpenError(Exception):
+    """tumalas.kz временно отключен предохранителем"""
+
+
+class CircuitBreaker:
+    """
+    Простой предохранитель: после failure_threshold ошибок подряд запросы
+    не выполняются reset_timeout секунд, затем пропускается одна пробная попытка.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Полуоткрытое состояние: пропускаем пробный запрос, при ошибке снова открываемся
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logging.warning(f"tumalas.kz недоступен, запросы приостановлены на {self.reset_timeout} с")
+            self.opened_at = time.monotonic()
+
+
+class TumalasClient:
+    """Асинхронный клиент tumalas.kz с таймаутами, keep-alive пулом и предохранителем"""
+
+    def __init__(self, base_url: str, breaker: CircuitBreaker, max_connections: Optional[int] = None):
+        self.base_url = base_url
+        self.breaker = breaker
+        self.max_connections = max_connections or settings.TUMALAS_MAX_CONNECTIONS
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'application/json, text/javascript, */*; q=0.01',
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(
+                    settings.TUMALAS_READ_TIMEOUT,
+                    connect=settings.TUMALAS_CONNECT_TIMEOUT,
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def get_children(self, t_id: int) -> list[dict]:
+        """Список детей узла tumalas с идентификатором t_id"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"tumalas.kz отключен предохранителем, узел {t_id}")
+
+        try:
+            url = httpx.URL(self.base_url).copy_merge_params({'id': t_id})
+            response = await self._get_client().get(url)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError):
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return data
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+tumalas_client = TumalasClient(
+    base_url=settings.TUMALAS_BASE_URL,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.TUMALAS_BREAKER_THRESHOLD,
+        reset_timeout=settings.TUMALAS_BREAKER_RESET_SECONDS,
+    ),
+)
@@ -1,28 +1,154 @@
-from fastapi import APIRouter
+import csv
+import io
+import json
+
+from fastapi import APIRouter, HTTPException, Query, Response
 from fastapi.params import Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
-from src.app.db.core import get_db
+from src.app.db.core import get_db, async_session_factory
 from src.app.config.auth import auth
+from src.app.config.base import settings
 from src.app.config.response import StandardResponse, autowrap
+from src.app.role.service import RoleService
+from .cache import children_cache
+from .prefetch import tree_prefetch
+from .singleflight import tree_flight
 from .service import TreeService
-from .schemas import SearchTree 
+from .schemas import SearchTree, TreeBatch
 
 
 router = APIRouter(prefix="/api/tree", tags=["tree"])
 
+
+async def check_moderator(db: AsyncSession, user_data: dict):
+    """Изменение структуры ветвей доступно только модераторам и администраторам"""
+    user_role = await RoleService(db).get_user_role(int(user_data["sub"]), default=1)
+    if user_role < 2:
+        raise HTTPException(status_code=403, detail="У вас нет прав на изменение ветвей")
+
+
 @router.get('/', response_model=StandardResponse[dict])
 @autowrap
-async def get_tree(node_id: int, user_data = Depends(auth.get_user_data_dependency()), db: AsyncSession = Depends(get_db)):
+async def get_tree(
+    node_id: int,
+    after: int = Query(None, ge=0),
+    limit: int = Query(None, ge=1, le=1000),
+    user_data = Depends(auth.get_user_data_dependency()),
+    db: AsyncSession = Depends(get_db),
+):
     service = TreeService(db)
-    return await service.get_tree_on_db(int(node_id), int(user_data["sub"]))
+    return await service.get_tree_on_db(int(node_id), int(user_data["sub"]), user_data, after=after, limit=limit)
 
 @router.get('/dev', response_model=StandardResponse[dict])
 @autowrap
-async def get_tree_dev(node_id: int, db: AsyncSession = Depends(get_db)):
+async def get_tree_dev(
+    node_id: int,
+    after: int = Query(None, ge=0),
+    limit: int = Query(None, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
     service = TreeService(db)
-    return await service.get_tree_on_db(int(node_id), 1)
+    return await service.get_tree_on_db(int(node_id), 1, after=after, limit=limit)
+
+@router.get('/suggest', response_model=StandardResponse[list])
+@autowrap
+async def suggest_names(q: str, limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_db)):
+    service = TreeService(db)
+    return await service.suggest_names(q, limit)
+
+@router.get('/subtree', response_model=StandardResponse[dict])
+@autowrap
+async def get_subtree(
+    node_id: int,
+    depth: int = Query(3, ge=1, le=20),
+    limit: int = Query(1000, ge=1, le=10000),
+    format: str = Query('nested', pattern='^(nested|flat)$'),
+    db: AsyncSession = Depends(get_db),
+):
+    service = TreeService(db)
+    return await service.get_subtree(node_id, depth, limit, nested=format == 'nested')
+
+@router.get('/subtree/stream')
+async def stream_subtree(
+    node_id: int,
+    depth: int = Query(3, ge=1, le=20),
+    limit: int = Query(100000, ge=1, le=1000000),
+):
+    async def ndjson():
+        # Отдельная сессия живёт столько же, сколько поток ответа
+        async with async_session_factory() as db:
+            async for item in TreeService(db).stream_subtree(node_id, depth, limit):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type='application/x-ndjson')
+
+@router.get('/export')
+async def export_subtree(
+    node_id: int,
+    format: str = Query('ndjson', pattern='^(ndjson|csv)$'),
+    db: AsyncSession = Depends(get_db),
+):
+    root = await TreeService(db).get_export_root(node_id)
+    root_depth = root.depth
+
+    async def rows():
+        # Отдельная сессия живёт столько же, сколько поток ответа
+        async with async_session_factory() as export_db:
+            async for batch in TreeService(export_db).export_subtree(node_id, root_depth):
+                yield batch
+
+    async def ndjson():
+        async for batch in rows():
+            yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+
+    async def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["id", "parent_id", "depth", "name", "birth", "death", "t_id"])
+        writer.writeheader()
+        async for batch in rows():
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    headers = {"Content-Disposition": f'attachment; filename="tree-{node_id}.{format}"'}
+    if format == 'csv':
+        return StreamingResponse(csv_lines(), media_type='text/csv; charset=utf-8', headers=headers)
+    return StreamingResponse(ndjson(), media_type='application/x-ndjson', headers=headers)
+
+@router.get('/relation', response_model=StandardResponse[dict])
+@autowrap
+async def get_relation(a: int, b: int, db: AsyncSession = Depends(get_db)):
+    service = TreeService(db)
+    return await service.get_relation(a, b)
+
+@router.get('/pedigree', response_model=StandardResponse[dict])
+@autowrap
+async def get_pedigree(
+    node_id: int,
+    response: Response,
+    generations: int = Query(7, ge=1, le=30),
+    db: AsyncSession = Depends(get_db),
+):
+    # Цепочки предков меняются редко, но после переноса ветви клиенты не должны
+    # долго видеть старую: внешний кэш короче внутреннего, который проверяется по снимку
+    response.headers["Cache-Control"] = f"public, max-age={settings.TREE_PEDIGREE_MAX_AGE_SECONDS}"
+    service = TreeService(db)
+    return await service.get_pedigree(node_id, generations)
+
+@router.get('/cache/stats', response_model=StandardResponse[dict])
+@autowrap
+async def get_cache_stats():
+    return {**children_cache.stats(), "single_flight": tree_flight.stats()}
+
+@router.get('/prefetch/stats', response_model=StandardResponse[dict])
+@autowrap
+async def get_prefetch_stats():
+    return tree_prefetch.stats()
 
 @router.get('/{node_id}', response_model=StandardResponse[dict])
 @autowrap
@@ -30,20 +156,58 @@ async def get_node_data(node_id: int, db: AsyncSession = Depends(get_db)):
     service = TreeService(db)
     return await service.get_tree_data(int(node_id))
 
+@router.post('/batch', response_model=StandardResponse[dict])
+@autowrap
+async def get_nodes_data(data: TreeBatch, db: AsyncSession = Depends(get_db)):
+    service = TreeService(db)
+    return await service.get_tree_data_batch(data.ids)
+
 @router.post('/delete/{node_id}', response_model=StandardResponse[dict])
 @autowrap
-async def delete_tree(node_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_tree(
+    node_id: int,
+    cascade: bool = False,
+    dry_run: bool = False,
+    max_nodes: int = Query(None, ge=1, le=settings.TREE_CASCADE_MAX_NODES),
+    user_data = Depends(auth.get_user_data_dependency()),
+    db: AsyncSession = Depends(get_db),
+):
+    if cascade:
+        await check_moderator(db, user_data)
     service = TreeService(db)
-    return await service.delete_tree_on_page(int(node_id))
+    return await service.delete_tree_on_page(int(node_id), cascade, dry_run, max_nodes)
 
 @router.post('/restore/{node_id}', response_model=StandardResponse[dict])
 @autowrap
-async def restore_tree(node_id: int, db: AsyncSession = Depends(get_db)):
+async def restore_tree(
+    node_id: int,
+    cascade: bool = False,
+    dry_run: bool = False,
+    max_nodes: int = Query(None, ge=1, le=settings.TREE_CASCADE_MAX_NODES),
+    user_data = Depends(auth.get_user_data_dependency()),
+    db: AsyncSession = Depends(get_db),
+):
+    if cascade:
+        await check_moderator(db, user_data)
+    service = TreeService(db)
+    return await service.restore_tree_on_page(int(node_id), cascade, dry_run, max_nodes)
+
+@router.post('/move/{node_id}', response_model=StandardResponse[dict])
+@autowrap
+async def move_tree(node_id: int, parent_id: int, user_data = Depends(auth.get_user_data_dependency()), db: AsyncSession = Depends(get_db)):
+    await check_moderator(db, user_data)
     service = TreeService(db)
-    return await service.restore_tree_on_page(int(node_id))
+    return await service.move_tree_on_page(int(node_id), int(parent_id))
 
 @router.post('/search', response_model=StandardResponse[SearchTree])
 @autowrap
 async def search_data_by_name(search: SearchTree, db: AsyncSession = Depends(get_db)):
     service = TreeService(db)
-    return await service.search_data_by_name(search.name, int(search.parent_id))
\ No newline at end of file
+    return await service.search_data_by_name(
+        search.name,
+        int(search.parent_id),
+        limit=search.limit,
+        after=search.after,
+        fuzzy=search.fuzzy,
+        min_similarity=search.min_similarity,
+    )
\ No newline at end of file